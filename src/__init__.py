@@ -1,16 +1,19 @@
-# File to handle imports
+# File to handle imports, the rules engine does not need pygame, see renderer_ and sprites_ for the front-end
 
 import os
-import pygame
 from collections import namedtuple
 from itertools import chain
 from collections import Counter
 import sys
-import pygame
 
-from .config import SCREEN_WIDTH, SCREEN_HEIGHT, SQUARE_SIZE, ASSETS_FOLDER, BOARD_FILE
-from .sprites_ import BoardSprite, PieceSprite, screen_to_chess, chess_to_screen
+from .config import SCREEN_WIDTH, SCREEN_HEIGHT, SQUARE_SIZE, FRAME_RATE, ASSETS_FOLDER, BOARD_FILE, ATLAS_FILE
 from .square_ import Square
+from . import tables_
+from . import bitboard_
+from . import zobrist_
+from . import evaluation_
 from .piece_ import Piece
-from .chess_ import Chess
-
+from .chess_ import Chess, Move
+from . import fen_
+from . import search_
+from . import parallel_
@@ -0,0 +1,170 @@
+from src import *
+from src.optional_ import np, require_numpy
+
+# Batch analysis of many positions at once. Positions are encoded as an N x 12 array of uint64 bitboards in
+# the order of Chess.bitboards, plus a boolean array of the current player. All functions follow the rules of
+# bitboard_, the same as Piece.compute_valid_squares / Piece.compute_attack_squares, with set-wise operations.
+
+_FULL = 0xFFFFFFFFFFFFFFFF
+_NOT_FILE_A = 0xFEFEFEFEFEFEFEFE
+_NOT_FILE_H = 0x7F7F7F7F7F7F7F7F
+_RANK_3 = 0xFF << 16
+_RANK_6 = 0xFF << 40
+
+# Shift of each sliding direction (dx, dy) in bits, and mask of the squares it can reach without wrapping
+_DIRECTIONS = {
+    (1, 0): (1, _NOT_FILE_A), (-1, 0): (-1, _NOT_FILE_H), (0, 1): (8, _FULL), (0, -1): (-8, _FULL),
+    (1, 1): (9, _NOT_FILE_A), (-1, 1): (7, _NOT_FILE_H), (1, -1): (-7, _NOT_FILE_A), (-1, -1): (-9, _NOT_FILE_H),
+}
+_KNIGHT_SHIFTS = [(17, _NOT_FILE_A), (15, _NOT_FILE_H), (10, 0xFCFCFCFCFCFCFCFC), (6, 0x3F3F3F3F3F3F3F3F),
+                  (-17, _NOT_FILE_H), (-15, _NOT_FILE_A), (-10, 0x3F3F3F3F3F3F3F3F), (-6, 0xFCFCFCFCFCFCFCFC)]
+
+
+def _shift(bb, s):
+    if s > 0:
+        return bb << np.uint64(s)
+    return bb >> np.uint64(-s)
+
+
+def _popcount(bb):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bb).astype(np.int64)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+    return table[bb.view(np.uint8).reshape(bb.shape + (8,))].sum(axis=-1)
+
+
+def _slide(gen, empty, direction):
+    """Kogge-Stone occluded fill: squares attacked along a direction by all sliders of gen"""
+    s, mask = _DIRECTIONS[direction]
+    mask = np.uint64(mask)
+    empty = empty & mask
+    for k in (1, 2, 4):
+        gen = gen | (empty & _shift(gen, s * k))
+        empty = empty & _shift(empty, s * k)
+    return _shift(gen, s) & mask
+
+
+def _attack_sets(boards, is_white, occupied):
+    """
+    List of bitboard arrays whose sum of popcounts is the number of attacked squares counted once per
+    attacking piece, and whose union is the set of attacked squares of one color
+    """
+    offset = 0 if is_white else 6
+    pawns, knights, bishops, rooks, queens, kings = (boards[:, offset + i] for i in range(6))
+    empty = ~occupied
+
+    sets = [_shift(pawns & np.uint64(_NOT_FILE_H), 9 if is_white else -7),
+            _shift(pawns & np.uint64(_NOT_FILE_A), 7 if is_white else -9)]
+    sets += [_shift(knights, s) & np.uint64(mask) for s, mask in _KNIGHT_SHIFTS]
+    for direction in _DIRECTIONS:
+        s, mask = _DIRECTIONS[direction]
+        sets.append(_shift(kings, s) & np.uint64(mask))
+        sliders = queens | (rooks if 0 in direction else bishops)
+        sets.append(_slide(sliders, empty, direction))
+    return sets
+
+
+def encode(positions):
+    """
+    Encode Chess objects for batch analysis
+    :param positions: iterable of Chess objects
+    :return: tuple (N x 12 uint64 array of bitboards, N boolean array with True if white is to move)
+    """
+    require_numpy("batch_")
+    boards, white_to_move = [], []
+    for chess in positions:
+        boards.append(chess.bitboards)
+        white_to_move.append(chess.is_current_white)
+    return np.array(boards, dtype=np.uint64).reshape(-1, 12), np.array(white_to_move, dtype=bool)
+
+
+def material(boards):
+    """
+    Material balance with the 1/3/3/5/9/0 scoring of Chess.game_score
+    :return: N integer array, positive when white is ahead
+    """
+    require_numpy("batch_")
+    return _popcount(boards) @ np.array(Chess._scores, dtype=np.int64)
+
+
+def _color_terms(boards, is_white, occupied):
+    """
+    :return: tuple (attacked squares, number of attacked enemy pieces, number of valid and attack squares)
+    """
+    own = np.bitwise_or.reduce(boards[:, :6] if is_white else boards[:, 6:], axis=1)
+    enemy = occupied & ~own
+    empty = ~occupied
+
+    sets = _attack_sets(boards, is_white, occupied)
+    attacked = np.zeros(len(boards), dtype=np.uint64)
+    attack_count = np.zeros(len(boards), dtype=np.int64)
+    for bb in sets:
+        attacked |= bb
+        attack_count += _popcount(bb & enemy)
+
+    # Pawns only move diagonally to capture, and push forward to empty squares
+    move_count = attack_count + sum(_popcount(bb & empty) for bb in sets[2:])
+    pawns = boards[:, 0 if is_white else 6]
+    single = _shift(pawns, 8 if is_white else -8) & empty
+    double = _shift(single & np.uint64(_RANK_3 if is_white else _RANK_6), 8 if is_white else -8) & empty
+    move_count += _popcount(single) + _popcount(double)
+
+    return attacked, attack_count, move_count
+
+
+def attacks(boards, is_white):
+    """
+    Squares attacked by one color, including squares of its own pieces
+    :return: N uint64 array of bitboards
+    """
+    require_numpy("batch_")
+    return _color_terms(boards, is_white, np.bitwise_or.reduce(boards, axis=1))[0]
+
+
+def attack_counts(boards, is_white):
+    """
+    Number of pieces of the other color attacked by one color, as Piece.attack_squares of all its pieces
+    :return: N integer array
+    """
+    require_numpy("batch_")
+    return _color_terms(boards, is_white, np.bitwise_or.reduce(boards, axis=1))[1]
+
+
+def mobility(boards, is_white):
+    """
+    Number of valid and attack squares of all pieces of one color, as in Chess.valid_moves and Chess.attack_moves
+    :return: N integer array
+    """
+    require_numpy("batch_")
+    return _color_terms(boards, is_white, np.bitwise_or.reduce(boards, axis=1))[2]
+
+
+def _in_check(boards, white_to_move, white_attacks, black_attacks):
+    return np.where(white_to_move, boards[:, 5] & black_attacks, boards[:, 11] & white_attacks) != 0
+
+
+def in_check(boards, white_to_move):
+    """
+    :return: N boolean array, True if the king of the current player is attacked
+    """
+    require_numpy("batch_")
+    return _in_check(boards, white_to_move, attacks(boards, True), attacks(boards, False))
+
+
+def analyze(boards, white_to_move):
+    """
+    All batch terms of N positions
+    :return: Dictionary of N arrays: material, attack counts and mobility of each color, and in-check flags
+    """
+    require_numpy("batch_")
+    occupied = np.bitwise_or.reduce(boards, axis=1)
+    white_attacks, white_attack_count, white_mobility = _color_terms(boards, True, occupied)
+    black_attacks, black_attack_count, black_mobility = _color_terms(boards, False, occupied)
+    return {
+        "material": material(boards),
+        "white_attack_count": white_attack_count,
+        "black_attack_count": black_attack_count,
+        "white_mobility": white_mobility,
+        "black_mobility": black_mobility,
+        "in_check": _in_check(boards, white_to_move, white_attacks, black_attacks),
+    }
@@ -0,0 +1,113 @@
+from src import *
+from src import perft_
+
+import argparse
+import json
+import platform
+import time
+
+# Benchmark positions as moves from the default setup
+POSITIONS = {
+    "default": [],
+    "italian": ["e2e4", "e7e5", "g1f3", "b8c6", "f1c4", "f8c5", "d2d3", "g8f6"],
+    "queens_gambit": ["d2d4", "d7d5", "c2c4", "e7e6", "b1c3", "g8f6", "c1g5", "f8e7"],
+}
+
+
+def _timed(function, repeat):
+    """Run function repeat times and return the total elapsed time in seconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return time.perf_counter() - start
+
+
+def _result(nodes, seconds):
+    return {"nodes": nodes, "seconds": seconds, "nodes_per_second": nodes / seconds if seconds > 0 else 0.0}
+
+
+def bench_perft(depth=3):
+    """Perft of every benchmark position, nodes are the leaf nodes"""
+    results = {}
+    for name, moves in POSITIONS.items():
+        chess = perft_.position(moves)
+        start = time.perf_counter()
+        nodes = perft_.perft(chess, depth)
+        results["perft_{}_{}".format(name, depth)] = _result(nodes, time.perf_counter() - start)
+    return results
+
+
+def bench_generate_moves(repeat=2000):
+    """Move generation of every benchmark position, nodes are the generated moves"""
+    results = {}
+    for name, moves in POSITIONS.items():
+        chess = perft_.position(moves)
+        nodes = len(chess.generate_moves()) * repeat
+        results["generate_moves_{}".format(name)] = _result(nodes, _timed(chess.generate_moves, repeat))
+    return results
+
+
+def bench_update_squares(repeat=2000):
+    """Chess.update_all_valid_squares and Chess.update_all_attack_squares, nodes are the updated pieces"""
+    results = {}
+    for name, moves in POSITIONS.items():
+        chess = perft_.position(moves)
+        nodes = bitboard_.popcount(chess.occupied) * repeat
+        results["update_all_valid_squares_{}".format(name)] = _result(nodes, _timed(chess.update_all_valid_squares,
+                                                                                    repeat))
+        results["update_all_attack_squares_{}".format(name)] = _result(nodes, _timed(chess.update_all_attack_squares,
+                                                                                     repeat))
+    return results
+
+
+def run(depth=3, repeat=2000):
+    """
+    Run all benchmark suites
+    :return: Dictionary ready to be stored as JSON, with the results under the key "results"
+    """
+    results = {}
+    results.update(bench_perft(depth))
+    results.update(bench_generate_moves(repeat))
+    results.update(bench_update_squares(repeat))
+    return {"python": platform.python_version(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+
+
+def compare(current, previous):
+    """
+    Print the speed of every benchmark relative to a previous run
+    :param current: Dictionary returned by run
+    :param previous: Dictionary returned by run, e.g. loaded from a JSON file
+    :return: None
+    """
+    for name, result in sorted(current["results"].items()):
+        old = previous["results"].get(name)
+        if old and old["nodes_per_second"] > 0:
+            ratio = result["nodes_per_second"] / old["nodes_per_second"]
+            print("{:45s} {:12.0f} nodes/s  x{:.2f}".format(name, result["nodes_per_second"], ratio))
+        else:
+            print("{:45s} {:12.0f} nodes/s".format(name, result["nodes_per_second"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move generation benchmarks")
+    parser.add_argument("--depth", type=int, default=3, help="perft depth")
+    parser.add_argument("--repeat", type=int, default=2000, help="repetitions of the micro-benchmarks")
+    parser.add_argument("--output", help="JSON file to store the results")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare against")
+    args = parser.parse_args()
+
+    current = run(args.depth, args.repeat)
+
+    previous = {"results": {}}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    compare(current, previous)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
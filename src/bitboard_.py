@@ -0,0 +1,136 @@
+from src import *
+
+# Piece codes: index into Chess.bitboards. White pieces take 0..5 and black pieces 6..11
+PIECE_NAMES = "PNBRQK"
+BLACK_OFFSET = 6
+
+FULL = (1 << 64) - 1
+RANK_1 = 0xFF
+RANK_2 = 0xFF << 8
+RANK_4 = 0xFF << 24
+RANK_5 = 0xFF << 32
+RANK_7 = 0xFF << 48
+RANK_8 = 0xFF << 56
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+
+
+def piece_code(name, is_white):
+    """Index of the bitboard storing pieces with this name and color"""
+    return PIECE_NAMES.index(name) + (0 if is_white else BLACK_OFFSET)
+
+
+def code_name(code):
+    """Inverse of piece_code, returns (name, is_white)"""
+    return PIECE_NAMES[code % BLACK_OFFSET], code < BLACK_OFFSET
+
+
+def square_bit(square):
+    return 1 << square.index
+
+
+def popcount(bb):
+    return bin(bb).count("1")
+
+
+def iter_bits(bb):
+    """Yield the indices of the set bits of a bitboard, lowest first"""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def knight_attacks(index):
+    return tables_.KNIGHT_MASKS[index]
+
+
+def king_attacks(index):
+    return tables_.KING_MASKS[index]
+
+
+def pawn_attacks(index, is_white):
+    return tables_.PAWN_ATTACK_MASKS[is_white][index]
+
+
+def pawn_pushes(index, is_white, occupied):
+    """Single and double pawn pushes, both stopped by any blocking piece"""
+    b = 1 << index
+    if is_white:
+        single = (b << 8) & FULL & ~occupied
+        double = (single & (RANK_2 << 8)) << 8 & ~occupied
+    else:
+        single = b >> 8 & ~occupied
+        double = (single & (RANK_7 >> 8)) >> 8 & ~occupied
+    return single | double
+
+
+def pawn_push_sources(index, is_white):
+    """Squares of the pawns of one color whose single or double push goes through the square index"""
+    b = 1 << index
+    if is_white:
+        return b >> 8 | (b & RANK_4) >> 16
+    return (b << 8 | (b & RANK_5) << 16) & FULL
+
+
+def slider_attacks(index, occupied, directions):
+    """Squares reached along each direction up to and including the first blocking piece"""
+    attacks = 0
+    for direction in directions:
+        ray = tables_.RAY_MASKS[direction][index]
+        blockers = ray & occupied
+        if blockers:
+            if direction in tables_.POSITIVE_DIRECTIONS:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= tables_.RAY_MASKS[direction][first]  # Cut the ray behind the closest blocker
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(index, occupied):
+    return slider_attacks(index, occupied, tables_.ROOK_DIRECTIONS)
+
+
+def bishop_attacks(index, occupied):
+    return slider_attacks(index, occupied, tables_.BISHOP_DIRECTIONS)
+
+
+def queen_attacks(index, occupied):
+    return slider_attacks(index, occupied, tables_.ROOK_DIRECTIONS + tables_.BISHOP_DIRECTIONS)
+
+
+def piece_attacks(code, index, occupied):
+    """Squares attacked by the piece with this code from index"""
+    name, is_white = code_name(code)
+    if name == "P":
+        return pawn_attacks(index, is_white)
+    elif name == "N":
+        return knight_attacks(index)
+    elif name == "B":
+        return bishop_attacks(index, occupied)
+    elif name == "R":
+        return rook_attacks(index, occupied)
+    elif name == "Q":
+        return queen_attacks(index, occupied)
+    return king_attacks(index)
+
+
+def piece_moves(code, index, occupied):
+    """Squares a piece can move to without capturing: empty squares it reaches without jumping over other pieces"""
+    name, is_white = code_name(code)
+    if name == "P":
+        return pawn_pushes(index, is_white, occupied)
+    return piece_attacks(code, index, occupied) & ~occupied
+
+
+def split_by_direction(squares_by_direction, bb):
+    """
+    Filter a direction-keyed dictionary of squares (as stored in Piece.valid_squares) with a bitboard
+    :param squares_by_direction: Dictionary with key = directions and values = list of squares
+    :param bb: bitboard of the squares to keep
+    :return: New dictionary with the same keys
+    """
+    return {direction: [s for s in squares if bb & square_bit(s)]
+            for direction, squares in squares_by_direction.items()}
@@ -0,0 +1,218 @@
+from src import *
+from src import fen_
+from src import pgn_
+
+import argparse
+import mmap
+import random
+import struct
+
+# Opening book in the layout of Polyglot books: a file of 16-byte big-endian entries (key, move, weight, learn)
+# sorted by key. Keys are Chess.position_key, so books are not interchangeable with Polyglot files that use
+# their own random numbers. Books are read through mmap: lookups touch only a few pages, and all processes
+# using the same file share one copy in the page cache.
+
+ENTRY = struct.Struct(">QHHI")
+_KEY = struct.Struct(">Q")
+MAX_WEIGHT = 0xFFFF
+
+_PROMOTION_CODES = " NBRQ"  # Bits 12-14 of an encoded move, as in Polyglot
+
+
+def encode_move(move):
+    """
+    :param move: Move
+    :return: 16-bit integer with the destination in bits 0-5, the origin in bits 6-11 and the promotion in 12-14
+    """
+    promotion = _PROMOTION_CODES.index(move.promotion) if move.promotion else 0
+    return promotion << 12 | move.from_square.index << 6 | move.to_square.index
+
+
+def decode_move(code):
+    """Inverse of encode_move"""
+    promotion = code >> 12 & 7
+    return Move(Square.from_index(code >> 6 & 63), Square.from_index(code & 63),
+                _PROMOTION_CODES[promotion] if promotion else None)
+
+
+class BookBuilder:
+    """
+    Collect the moves played in the first plies of many games, then write them as a sorted book file.
+    The weight of a move is the number of times it was played in the position.
+    """
+
+    def __init__(self, max_ply=20):
+        """
+        :param max_ply: number of plies of each game added to the book
+        """
+        self.max_ply = max_ply
+        self.weights = Counter()  # Key = (position key, encoded move)
+
+    def add_moves(self, moves, chess=None):
+        """
+        Add a line of play
+        :param moves: iterable of Move or moves in coordinate notation, e.g. ["e2e4", "e7e5"]
+        :param chess: Chess object with the starting position, the default setup if None; it is left after the
+                      added moves
+        :return: number of added moves
+        """
+        chess = chess if chess is not None else Chess(setup="default")
+        count = 0
+        for move in moves:
+            if count == self.max_ply:
+                break
+            if not isinstance(move, Move):
+                move = Move.from_string(move)
+            if not chess.is_legal(move):
+                raise ValueError("Illegal move {} in {}".format(move, fen_.to_fen(chess)))
+            self.weights[chess.position_key, encode_move(move)] += 1
+            chess.make_move(move)
+            count += 1
+        return count
+
+    def add_game(self, game):
+        """
+        Add the first plies of a PGN game, see pgn_.read_games
+        :param game: pgn_.Game
+        :return: number of added moves, up to the first move that cannot be resolved
+        """
+        fen = game.headers.get("FEN")
+        chess = fen_.from_fen(fen) if fen else Chess(setup="default")
+        count = 0
+        for san in game.moves[:self.max_ply]:
+            try:
+                move = pgn_.resolve_san(chess, san)
+            except ValueError:
+                break
+            self.weights[chess.position_key, encode_move(move)] += 1
+            chess.make_move(move)
+            count += 1
+        return count
+
+    def add_pgn(self, path):
+        """
+        Add all games of a PGN file, read one at a time
+        :return: number of added games
+        """
+        count = 0
+        with open(path, encoding="utf-8", errors="replace") as lines:
+            for game in pgn_.read_games(lines):
+                self.add_game(game)
+                count += 1
+        return count
+
+    def write(self, path):
+        """
+        Write the book sorted by key, and by weight from the highest within a key. Weights are scaled down to
+        16 bits when needed.
+        :return: number of written entries
+        """
+        top = max(self.weights.values(), default=0)
+        scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+        entries = sorted((key, -weight, move) for (key, move), weight in self.weights.items())
+        with open(path, "wb") as output:
+            for key, negative_weight, move in entries:
+                output.write(ENTRY.pack(key, move, max(1, int(-negative_weight * scale)), 0))
+        return len(entries)
+
+
+class OpeningBook:
+    """
+    Read-only book file mapped in memory, with moves looked up by binary search of the position key
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.size = self._file.seek(0, 2) // ENTRY.size  # Number of entries
+        # Empty files cannot be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def _first_index(self, key):
+        """Index of the first entry with a key not lower than key"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if _KEY.unpack_from(self._map, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, chess):
+        """
+        Book moves of a position, leaving out moves that are not legal, e.g. after a key collision
+        :param chess: Chess object
+        :return: list of tuples (Move, weight), highest weight first
+        """
+        key = chess.position_key
+        moves = []
+        index = self._first_index(key)
+        while index < self.size:
+            entry_key, code, weight, _ = ENTRY.unpack_from(self._map, index * ENTRY.size)
+            if entry_key != key:
+                break
+            move = decode_move(code)
+            if chess.is_legal(move):
+                moves.append((move, weight))
+            index += 1
+        return moves
+
+    def choose(self, chess, rng=random):
+        """
+        Pick a book move at random with probability proportional to its weight
+        :param rng: random.Random object, e.g. seeded for reproducible games
+        :return: Move or None if the position is not in the book
+        """
+        moves = self.entries(chess)
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def best(self, chess):
+        """
+        :return: book Move with the highest weight, None if the position is not in the book
+        """
+        moves = self.entries(chess)
+        return moves[0][0] if moves else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="compile PGN files into a book")
+    build.add_argument("book", help="output book file")
+    build.add_argument("pgn", nargs="+", help="PGN files")
+    build.add_argument("--plies", type=int, default=20, help="plies of each game added to the book")
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book", help="book file")
+    probe.add_argument("fen", nargs="?", default=fen_.DEFAULT_FEN, help="position, the default setup if left out")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        builder = BookBuilder(args.plies)
+        games = sum(builder.add_pgn(path) for path in args.pgn)
+        entries = builder.write(args.book)
+        print("Games: {}, entries: {}".format(games, entries))
+    else:
+        with OpeningBook(args.book) as book:
+            for move, weight in book.entries(fen_.from_fen(args.fen)):
+                print("{} {}".format(move, weight))
+
+
+if __name__ == "__main__":
+    main()
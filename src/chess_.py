@@ -1,26 +1,309 @@
 from src import *
 
+PROMOTIONS = "QRBN"  # Piece names a pawn can promote to, best first
+
+CASTLING_LETTERS = "KQkq"  # Letter of bit i of Chess.castling_rights
+
+# Castling rights kept after a move from or to each square index: moving the king or a rook, or capturing a rook
+# in its corner, loses the rights of that piece
+_CASTLING_MASKS = [15] * 64
+_CASTLING_MASKS[4], _CASTLING_MASKS[7], _CASTLING_MASKS[0] = 12, 14, 13  # e1, h1, a1
+_CASTLING_MASKS[60], _CASTLING_MASKS[63], _CASTLING_MASKS[56] = 3, 11, 7  # e8, h8, a8
+
+# Key = castling right bit: (king from, king to, squares that must be empty, squares that must not be attacked)
+_CASTLINGS = {
+    1: (4, 6, 0x60, (4, 5, 6)),
+    2: (4, 2, 0x0E, (4, 3, 2)),
+    4: (60, 62, 0x60 << 56, (60, 61, 62)),
+    8: (60, 58, 0x0E << 56, (60, 59, 58)),
+}
+# Key = king destination of a castling: (rook from, rook to)
+_CASTLING_ROOKS = {6: (7, 5), 2: (0, 3), 62: (63, 61), 58: (56, 59)}
+
+# Piece values by code to order captures by most valuable victim / least valuable attacker, see Chess.iter_moves
+_ORDER_VALUES = [1, 3, 3, 5, 9, 100] * 2
+
+
+class Move(namedtuple("BaseMove", "from_square to_square promotion")):
+    """
+    Move of a piece between two Squares, printed in coordinate notation, e.g. "e2e4", or "e7e8q" for a
+    promotion. Castling is written as the two-square move of the king, e.g. "e1g1".
+    """
+
+    def __new__(cls, from_square, to_square, promotion=None):
+        """
+        :param promotion: name of the piece a pawn promotes to, see PROMOTIONS, None for other moves
+        """
+        return super().__new__(cls, from_square, to_square, promotion)
+
+    @classmethod
+    def from_string(cls, text):
+        """
+        Parse a move in coordinate notation
+        :param text: string as "e2e4" or "e7e8q"
+        :return: Move
+        """
+        assert len(text) in (4, 5), "Move must be written as two squares, e.g. e2e4"
+        promotion = text[4].upper() if len(text) == 5 else None
+        assert promotion is None or promotion in PROMOTIONS, "Invalid promotion piece {}".format(text[4:])
+        return cls(Square.from_name(text[:2]), Square.from_name(text[2:4]), promotion)
+
+    def __str__(self):
+        text = self.from_square.name + self.to_square.name
+        return text + self.promotion.lower() if self.promotion else text
+
 
 class Chess:
     """
     Class for all game management
     """
     _valuations = {'P': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 0}
+    _scores = [1, 3, 3, 5, 9, 0, -1, -3, -3, -5, -9, 0]  # Signed valuations by piece code, see bitboard_.PIECE_NAMES
 
-    def __init__(self, is_current_white=True, setup=""):
+    def __init__(self, is_current_white=True, setup="", incremental=False, check_incremental=False):
         """
         Initialize the board on the starting setup for chess
+        :param incremental: after a move, update the valid and attack squares only of the pieces affected by it
+        :param check_incremental: debug option, compare every incremental update against a full recomputation
         """
         self.is_current_white = is_current_white
-        self.active_white = []
-        self.active_black = []
         self.dead_white = []
         self.dead_black = []
-        self.score = 0
+        self.score = 0  # Material balance with 1/3/3/5/9/0 scoring, updated with every change of a piece
+        self.evaluation = 0  # Material and piece-square terms in centipawns, see evaluation_
+
+        # Position is stored as one bitboard per piece type and color, see bitboard_.piece_code
+        self.bitboards = [0] * 12
+        self.occupied_white = 0
+        self.occupied_black = 0
+        self.occupied = 0
+        self.board = [None] * 64  # Mailbox with the piece code on each square index, None for empty squares
+
+        # Zobrist hash of the position, updated with every change of a piece or of the current player
+        self.position_key = 0 if is_current_white else zobrist_.BLACK_TO_MOVE_KEY
+
+        # Bitboards of valid and attack squares for every active piece, key = square index
+        self.valid_moves = {}
+        self.attack_moves = {}
+        self.incremental = incremental
+        self.check_incremental = check_incremental
+        self._squares_current = False  # True while valid_moves and attack_moves match the position
+
+        self._view = None  # Cached (active_white, active_black) lists of the pieces
+        self._piece_views = None  # Cached Piece objects built so far, key = square index
+        self._attack_maps = None  # Cached [black, white] bitboards of attacked squares, see Chess.attack_map
+        self._check = None  # Cached check and pin information of the current player, see Chess._check_info
+
+        # Game state fields of the FEN notation, see fen_. Castling rights and en passant square are part of the
+        # hash, set them with the castling and en_passant properties.
+        self.castling_rights = 0  # Bits of the rights in CASTLING_LETTERS, e.g. 15 for "KQkq"
+        self.en_passant_index = None  # Square behind a pawn that just moved two squares, if it can be captured
+        self.halfmove_clock = 0  # Plies since the last capture or pawn move
+        self.fullmove_number = 1
+
+        # One entry per played move: (from index, to index, piece code, captured code, captured index,
+        # promoted code, is_current_white, score, halfmove_clock, castling_rights, en_passant_index, True if
+        # Chess.move added the captured piece to the dead pieces)
+        self._undo_stack = []
 
         if setup.lower() == 'default':  # Full chess game
-            pass
-            # TODO: rewrite full chess initial setup
+            self.castling = "KQkq"
+            for x, name in enumerate("RNBQKBNR"):
+                self._set_piece(bitboard_.piece_code(name, True), x)
+                self._set_piece(bitboard_.piece_code("P", True), 8 + x)
+                self._set_piece(bitboard_.piece_code("P", False), 48 + x)
+                self._set_piece(bitboard_.piece_code(name, False), 56 + x)
+
+    @property
+    def castling(self):
+        """Castling rights as in FEN, e.g. "KQkq", or "-" without rights"""
+        rights = self.castling_rights
+        return "".join(letter for bit, letter in enumerate(CASTLING_LETTERS) if rights >> bit & 1) or "-"
+
+    @castling.setter
+    def castling(self, text):
+        self._set_castling_rights(sum(1 << CASTLING_LETTERS.index(letter) for letter in set(text)
+                                      if letter in CASTLING_LETTERS))
+
+    @property
+    def en_passant(self):
+        """Square behind a pawn that just moved two squares, None if there is none"""
+        return Square.from_index(self.en_passant_index) if self.en_passant_index is not None else None
+
+    @en_passant.setter
+    def en_passant(self, square):
+        """The square is dropped when no pawn of the current player can take on it, as in Chess.make_move"""
+        index = square.index if square is not None else None
+        if index is not None and not self._can_take_en_passant(index, self.is_current_white):
+            index = None
+        if index != self.en_passant_index:
+            self._set_en_passant(index)
+
+    def _can_take_en_passant(self, index, by_white):
+        """
+        Only capturable en passant squares are kept, so that equal positions have equal hashes
+        :param index: en passant square
+        :param by_white: color of the capturing pawns
+        :return: True if a pawn of by_white attacks the square
+        """
+        pawns = self.bitboards[0 if by_white else bitboard_.BLACK_OFFSET]
+        return bool(bitboard_.pawn_attacks(index, not by_white) & pawns)
+
+    def _set_castling_rights(self, rights):
+        self.position_key ^= zobrist_.CASTLING_KEYS[self.castling_rights] ^ zobrist_.CASTLING_KEYS[rights]
+        self.castling_rights = rights
+
+    def _set_en_passant(self, index):
+        if self.en_passant_index is not None:
+            self.position_key ^= zobrist_.EN_PASSANT_KEYS[self.en_passant_index % 8]
+        if index is not None:
+            self.position_key ^= zobrist_.EN_PASSANT_KEYS[index % 8]
+        self.en_passant_index = index
+
+    @property
+    def active_white(self):
+        """List of active white pieces, built on request from the bitboards"""
+        return self._active_view()[0]
+
+    @property
+    def active_black(self):
+        """List of active black pieces, built on request from the bitboards"""
+        return self._active_view()[1]
+
+    def _active_view(self):
+        if self._view is None:
+            active_white, active_black = [], []
+            for index, code in enumerate(self.board):
+                if code is not None:
+                    (active_white if code < bitboard_.BLACK_OFFSET else active_black).append(self._piece_at(index))
+            self._view = active_white, active_black
+        return self._view
+
+    def piece_at(self, square):
+        """
+        Active piece in a square, the same object as in Chess.active_white or Chess.active_black. Only the Piece
+        of this square is built, not the views of all the pieces.
+        :param square: Square
+        :return: Piece object or None if the square is empty
+        """
+        return self._piece_at(square.index)
+
+    def _piece_at(self, index):
+        code = self.board[index]
+        if code is None:
+            return None
+        views = self._piece_views
+        if views is None:
+            views = self._piece_views = {}
+        piece = views.get(index)
+        if piece is None:
+            piece = views[index] = self._piece_view(code, index)
+        return piece
+
+    def _piece_view(self, code, index):
+        """
+        Build the Piece object for the piece with this code in the square index
+        :return: Piece object with valid and attack squares filled from the last update
+        """
+        name, is_white = bitboard_.code_name(code)
+        piece = Piece(name, is_white, True, Square.from_index(index))
+        if index in self.valid_moves:
+            piece.valid_squares = bitboard_.split_by_direction(piece.valid_squares, self.valid_moves[index])
+        if index in self.attack_moves:
+            piece.attack_squares = bitboard_.split_by_direction(piece.attack_squares, self.attack_moves[index])
+        return piece
+
+    def _code_at(self, index, is_white=None):
+        """
+        Code of the piece in the square index from the mailbox, optionally restricted to one color
+        :return: integer code or None if the square is empty
+        """
+        code = self.board[index]
+        if code is None or is_white is None or (code < bitboard_.BLACK_OFFSET) == is_white:
+            return code
+        return None
+
+    def _set_piece(self, code, index):
+        bit = 1 << index
+        self.bitboards[code] |= bit
+        if code < bitboard_.BLACK_OFFSET:
+            self.occupied_white |= bit
+        else:
+            self.occupied_black |= bit
+        self.occupied |= bit
+        self.board[index] = code
+        self.position_key ^= zobrist_.PIECE_KEYS[code][index]
+        self.score += Chess._scores[code]
+        self.evaluation += evaluation_.PIECE_SQUARE_VALUES[code][index]
+        self._view = self._piece_views = None
+        self._attack_maps = self._check = None
+        self._squares_current = False
+
+    def _clear_piece(self, code, index):
+        mask = ~(1 << index)
+        self.bitboards[code] &= mask
+        if code < bitboard_.BLACK_OFFSET:
+            self.occupied_white &= mask
+        else:
+            self.occupied_black &= mask
+        self.occupied &= mask
+        self.board[index] = None
+        self.position_key ^= zobrist_.PIECE_KEYS[code][index]
+        self.score -= Chess._scores[code]
+        self.evaluation -= evaluation_.PIECE_SQUARE_VALUES[code][index]
+        self._view = self._piece_views = None
+        self._attack_maps = self._check = None
+        self._squares_current = False
+
+    def get_state(self):
+        """
+        Compact picklable form of the position, e.g. to send it to another process
+        :return: tuple (tuple of the 12 piece bitboards, is_current_white, castling_rights, en_passant_index)
+        """
+        return tuple(self.bitboards), self.is_current_white, self.castling_rights, self.en_passant_index
+
+    @classmethod
+    def from_state(cls, state, **kwargs):
+        """
+        Build a game from the output of Chess.get_state
+        :param state: tuple (piece bitboards, is_current_white, castling_rights, en_passant_index)
+        :param kwargs: other arguments of Chess
+        :return: Chess object
+        """
+        bitboards, is_current_white, castling_rights, en_passant_index = state
+        chess = cls(is_current_white=is_current_white, **kwargs)
+        chess._load_bitboards(bitboards)
+        chess._set_castling_rights(castling_rights)
+        chess._set_en_passant(en_passant_index)
+        return chess
+
+    def _load_bitboards(self, bitboards):
+        """
+        Replace all pieces at once, computing occupancy, hash, score and evaluation in a single pass
+        :param bitboards: 12 piece bitboards, assumed to be valid
+        :return: None
+        """
+        self.bitboards = list(bitboards)
+        self.board = board = [None] * 64
+        self.occupied_white = self.occupied_black = 0
+        self.score = self.evaluation = 0
+        key = zobrist_.compute_key((), self.is_current_white, self.castling_rights, self.en_passant_index)
+        for code, bb in enumerate(self.bitboards):
+            if code < bitboard_.BLACK_OFFSET:
+                self.occupied_white |= bb
+            else:
+                self.occupied_black |= bb
+            keys, values = zobrist_.PIECE_KEYS[code], evaluation_.PIECE_SQUARE_VALUES[code]
+            for index in bitboard_.iter_bits(bb):
+                board[index] = code
+                key ^= keys[index]
+                self.evaluation += values[index]
+                self.score += Chess._scores[code]
+        self.occupied = self.occupied_white | self.occupied_black
+        self.position_key = key
+        self._view = self._piece_views = None
+        self._attack_maps = self._check = None
+        self._squares_current = False
 
     def add_piece(self, piece):
         """
@@ -28,13 +311,16 @@ class Chess:
         :param piece: Piece object
         :return: None
         """
-        if piece.is_white:
-            self.active_white.append(piece)
-        else:
-            self.active_black.append(piece)
+        if not piece.state:
+            (self.dead_white if piece.is_white else self.dead_black).append(piece)
+            return
 
-        self.active_white, self.dead_white = Chess.check_active(self.active_white, self.dead_white)
-        self.active_black, self.dead_black = Chess.check_active(self.active_black, self.dead_black)
+        index = piece.square.index
+        if self.occupied & (1 << index):
+            print("ERROR: Square {} is occupied more than once".format(piece.square), file=sys.stderr)
+            assert False, "Invalid pieces"
+
+        self._set_piece(bitboard_.piece_code(piece.name, piece.is_white), index)
 
         assert self._test_active(), "Invalid pieces"
 
@@ -45,10 +331,10 @@ class Chess:
         """
         board = [["" for _ in range(8)] for __ in range(8)]
 
-        all_active = self.active_white + self.active_black
-        for piece in all_active:
-            col, row = piece.square
-            board[row][col] = piece.name + ("w" if piece.is_white else "b")
+        for code, bb in enumerate(self.bitboards):
+            name, is_white = bitboard_.code_name(code)
+            for index in bitboard_.iter_bits(bb):
+                board[index // 8][index % 8] = name + ("w" if is_white else "b")
 
         line = " " + "-- " * 8 + "\n"
         board_string = line
@@ -108,20 +394,15 @@ class Chess:
 
     def game_score(self):
         """
-        Compute game score with 1/3/3/5/9/0 scoring
+        Game score with 1/3/3/5/9/0 scoring, kept up to date with every move and capture
         :return:
         score: signed integer
         """
-        all_active = self.active_white + self.active_black
-        for piece in all_active:
-            if piece.state:
-                if piece.is_white:
-                    self.score += Chess._valuations[piece.name]
-                else:
-                    self.score -= Chess._valuations[piece.name]
         return self.score
 
     def switch_current_player(self):
+        self.position_key ^= zobrist_.BLACK_TO_MOVE_KEY
+        self._check = None
         if self.is_current_white:
             self.is_current_white = False
             return
@@ -157,122 +438,594 @@ class Chess:
     #
     #     return current_square, future_square
 
-    def move(self, current_square, new_square):
+    def move(self, current_square, new_square, promotion="Q"):
         """
         :param current_square:
         :param new_square:
-        :return: None
+        :param promotion: name of the piece a pawn reaching the last rank promotes to, one of PROMOTIONS; ignored,
+                          and can be None, for other moves
+        :return: True if the move was played, False if it is invalid
         """
         # current_square, future_square = self.parse_move(entry)
-
-        # Obtain active player pieces
-        active = self.get_active()
-
-        # TODO: change this exception handling to normal logic
-        try:  # This works as only one active piece can be in a square at the same time
-            [current_piece] = [piece for piece in active if piece.square == current_square]
-        except ValueError:
+        # Obtain the active player piece on the current square
+        current_index = current_square.index
+        code = self._code_at(current_index, self.is_current_white)
+        if code is None:
             print("----- Wrong player")  # Active player does not coincide with move
             return False
 
         # Update valid squares considering all pieces in the board
-        self.update_all_valid_squares()
-
-        if new_square in list(chain(*current_piece.valid_squares.values())):
-            current_piece.change_square(new_square)
-        else:
+        if not (self.incremental and self._squares_current):
+            self.update_all_valid_squares()
+            self.update_all_attack_squares()
+            self._squares_current = True
+
+        new_index = new_square.index
+        new_bit = 1 << new_index
+        move = Move(current_square, new_square)
+        special = move in self._special_moves()  # Castling and en passant, already tested for checks
+        if not special and not (self.valid_moves[current_index] | self.attack_moves[current_index]) & new_bit:
             print("----- Move is invalid")
             return False
-
-        self.active_white, self.dead_white = Chess.check_active(self.active_white, self.dead_white)
-        self.active_black, self.dead_black = Chess.check_active(self.active_black, self.dead_black)
+        if not special and not self._legal_mask(code, current_index, self._check_info()) & new_bit:
+            print("----- Move leaves the king in check")
+            return False
+        if code % bitboard_.BLACK_OFFSET == 0 and new_bit & (bitboard_.RANK_1 | bitboard_.RANK_8):
+            if promotion is None or promotion not in tuple(PROMOTIONS):
+                return False
+            move = Move(current_square, new_square, promotion)
+
+        captured = self.make_move(move)  # also switches the current player
+        captured_index = self._undo_stack[-1][4]
+        if captured is not None:
+            name, is_white = bitboard_.code_name(captured)
+            (self.dead_white if is_white else self.dead_black).append(
+                Piece(name, is_white, False, Square.from_index(captured_index)))
+            self._undo_stack[-1] = self._undo_stack[-1][:-1] + (True,)
 
         assert self._test_active(), "Invalid pieces"
 
-        self.switch_current_player()  # change square of moved piece and compute new valid moves
-        self.update_all_valid_squares()  # Update valid moves with new board positions
+        # Update valid moves with new board positions
+        if self.incremental:
+            changed = [current_index, new_index, captured_index]
+            if new_index in _CASTLING_ROOKS and code % bitboard_.BLACK_OFFSET == 5 and \
+                    abs(new_index - current_index) == 2:
+                changed.extend(_CASTLING_ROOKS[new_index])
+            self._update_moved_squares(*changed)
+        else:
+            self.update_all_valid_squares()
+            self.update_all_attack_squares()
+            self._squares_current = True
 
         return True
 
-    def update_all_valid_squares(self):
+    def attack_map(self, is_white):
         """
-        Update all active pieces valid squares, update the member Piece.valid_pieces dictionary
-        :return: None
+        Squares attacked by the pieces of one color, computed once per position and cached until it changes
+        :param is_white: color of the attacking pieces
+        :return: bitboard
         """
+        maps = self._attack_maps
+        if maps is None:
+            maps = self._attack_maps = [None, None]
+        if maps[is_white] is None:
+            bb = self.bitboards
+            offset = 0 if is_white else bitboard_.BLACK_OFFSET
+            occupied = self.occupied
+            pawns = bb[offset]
+            if is_white:
+                attacks = ((pawns & ~bitboard_.FILE_H) << 9 | (pawns & ~bitboard_.FILE_A) << 7) & bitboard_.FULL
+            else:
+                attacks = (pawns & ~bitboard_.FILE_A) >> 9 | (pawns & ~bitboard_.FILE_H) >> 7
+            for index in bitboard_.iter_bits(bb[offset + 1]):
+                attacks |= bitboard_.knight_attacks(index)
+            for index in bitboard_.iter_bits(bb[offset + 2] | bb[offset + 4]):
+                attacks |= bitboard_.bishop_attacks(index, occupied)
+            for index in bitboard_.iter_bits(bb[offset + 3] | bb[offset + 4]):
+                attacks |= bitboard_.rook_attacks(index, occupied)
+            for index in bitboard_.iter_bits(bb[offset + 5]):
+                attacks |= bitboard_.king_attacks(index)
+            maps[is_white] = attacks
+        return maps[is_white]
+
+    def is_attacked(self, square, by_white):
+        """
+        Test if a piece of one color attacks a square, from the cached Chess.attack_map
+        :param square: Square
+        :param by_white: color of the attacking pieces
+        :return: True or False
+        """
+        return bool(self.attack_map(by_white) >> square.index & 1)
+
+    def _attackers(self, index, by_white, occupied):
+        """Bitboard of the pieces of one color attacking the square index, looking from the square"""
+        bb = self.bitboards
+        offset = 0 if by_white else bitboard_.BLACK_OFFSET
+        return (bitboard_.pawn_attacks(index, not by_white) & bb[offset] |
+                bitboard_.knight_attacks(index) & bb[offset + 1] |
+                bitboard_.king_attacks(index) & bb[offset + 5] |
+                bitboard_.bishop_attacks(index, occupied) & (bb[offset + 2] | bb[offset + 4]) |
+                bitboard_.rook_attacks(index, occupied) & (bb[offset + 3] | bb[offset + 4]))
+
+    def _check_info(self):
+        """
+        Check and pin information of the current player, cached until the position or the player changes
+        :return: tuple (king index or None, bitboard of checkers, dictionary with key = index of a pinned piece and
+                 value = bitboard of the squares it can still move to, bitboard of the squares a piece other than
+                 the king must move to, bitboard of the squares the king cannot move to)
+        """
+        if self._check is not None:
+            return self._check
+
+        is_white = self.is_current_white
+        bb = self.bitboards
+        offset = 0 if is_white else bitboard_.BLACK_OFFSET
+        enemy_offset = bitboard_.BLACK_OFFSET - offset
+        kings = bb[offset + 5]
+        if not kings:  # Positions without a king, e.g. the demo setup of Chess.game, have no checks
+            self._check = None, 0, {}, bitboard_.FULL, 0
+            return self._check
+
+        king = kings.bit_length() - 1
+        occupied = self.occupied
+        own, enemy = (self.occupied_white, self.occupied_black) if is_white else (self.occupied_black,
+                                                                                 self.occupied_white)
+        checkers = self._attackers(king, not is_white, occupied)
+        danger = self.attack_map(not is_white)
+
+        # Sliders that reach the king through exactly one piece of the current player pin that piece
+        pins = {}
+        queens = bb[enemy_offset + 4]
+        for sliders, attacks in ((bb[enemy_offset + 3] | queens, bitboard_.rook_attacks),
+                                 (bb[enemy_offset + 2] | queens, bitboard_.bishop_attacks)):
+            for pinner in bitboard_.iter_bits(attacks(king, enemy) & sliders):
+                between = tables_.BETWEEN[king][pinner]
+                blockers = between & occupied
+                if blockers & own and not blockers & (blockers - 1):
+                    pins[blockers.bit_length() - 1] = between | (1 << pinner)
+
+        if not checkers:
+            evasions = bitboard_.FULL
+        elif checkers & (checkers - 1):  # Double check, only the king can move
+            evasions = 0
+        else:
+            checker = checkers.bit_length() - 1
+            evasions = checkers | tables_.BETWEEN[king][checker]
+        # The king cannot step back along the line of a checking slider, which the king itself hides
+        for checker in bitboard_.iter_bits(checkers & ~(bb[enemy_offset] | bb[enemy_offset + 1])):
+            danger |= bitboard_.piece_attacks(self.board[checker], checker, occupied & ~kings)
 
-        all_active = self.active_white + self.active_black
-
-        occupied_squares = [piece.square for piece in all_active]
+        self._check = king, checkers, pins, evasions, danger
+        return self._check
 
-        for current_piece in all_active:  # Update to all pieces
+    def in_check(self):
+        """
+        :return: True if the king of the current player is attacked
+        """
+        return self._check_info()[1] != 0
+
+    @property
+    def checkers(self):
+        """Bitboard of the pieces giving check to the current player"""
+        return self._check_info()[1]
+
+    @property
+    def pinned(self):
+        """Bitboard of the pieces of the current player pinned to their king"""
+        pinned = 0
+        for index in self._check_info()[2]:
+            pinned |= 1 << index
+        return pinned
+
+    def _legal_mask(self, code, index, info):
+        """Squares where the piece with this code on the square index can move without leaving its king attacked"""
+        king, checkers, pins, evasions, danger = info
+        if index == king:
+            return ~danger
+        return evasions & pins.get(index, bitboard_.FULL)
+
+    def generate_moves(self, legal=True):
+        """
+        Generate the moves of the current player, captures, promotions, castling and en passant included,
+        from the bitboards
+        :param legal: leave out the moves that leave the king of the current player attacked, from the cached
+                      check and pin information, otherwise generate pseudo-legal moves
+        :return: list of Move
+        """
+        if self.is_current_white:
+            codes, enemy = range(bitboard_.BLACK_OFFSET), self.occupied_black
+        else:
+            codes, enemy = range(bitboard_.BLACK_OFFSET, 12), self.occupied_white
+        occupied = self.occupied
+        last_ranks = bitboard_.RANK_1 | bitboard_.RANK_8
+        info = self._check_info() if legal else None
+
+        moves = []
+        for code in codes:
+            is_pawn = code % bitboard_.BLACK_OFFSET == 0
+            for index in bitboard_.iter_bits(self.bitboards[code]):
+                targets = bitboard_.piece_moves(code, index, occupied) | \
+                          bitboard_.piece_attacks(code, index, occupied) & enemy
+                if legal:
+                    targets &= self._legal_mask(code, index, info)
+                from_square = Square.from_index(index)
+                if is_pawn and targets & last_ranks:
+                    for target in bitboard_.iter_bits(targets):
+                        to_square = Square.from_index(target)
+                        moves.extend(Move(from_square, to_square, name) for name in PROMOTIONS)
+                else:
+                    moves.extend(Move(from_square, Square.from_index(target))
+                                 for target in bitboard_.iter_bits(targets))
+        moves.extend(self._special_moves(legal))
+        return moves
 
-            # Compute individual valid pieces
-            current_piece.valid_squares = current_piece.compute_valid_squares()
+    def _special_moves(self, legal=True):
+        """
+        Castling and en passant moves of the current player, which Chess.valid_moves and Chess.attack_moves
+        leave out
+        :param legal: leave out en passant captures that leave the king attacked
+        :return: list of Move
+        """
+        return self._en_passant_moves(legal) + self._castling_moves()
+
+    def _en_passant_moves(self, legal=True):
+        moves = []
+        if self.en_passant_index is not None:
+            pawns = self.bitboards[0 if self.is_current_white else bitboard_.BLACK_OFFSET]
+            to_square = Square.from_index(self.en_passant_index)
+            for index in bitboard_.iter_bits(bitboard_.pawn_attacks(self.en_passant_index,
+                                                                    not self.is_current_white) & pawns):
+                move = Move(Square.from_index(index), to_square)
+                if not legal or self._en_passant_is_legal(move):
+                    moves.append(move)
+        return moves
+
+    def _castling_moves(self):
+        """
+        Castling needs its rights, the king and rook in place, the squares between them empty, and the king not
+        in check nor passing through an attacked square
+        """
+        moves = []
+        is_white = self.is_current_white
+        rights = self.castling_rights & (3 if is_white else 12)
+        if rights:
+            bb = self.bitboards
+            offset = 0 if is_white else bitboard_.BLACK_OFFSET
+            danger = self.attack_map(not is_white)
+            for bit, (king_from, king_to, empty, safe) in _CASTLINGS.items():
+                if rights & bit and not self.occupied & empty and bb[offset + 5] >> king_from & 1 and \
+                        bb[offset + 3] >> _CASTLING_ROOKS[king_to][0] & 1 and \
+                        not any(danger >> index & 1 for index in safe):
+                    moves.append(Move(Square.from_index(king_from), Square.from_index(king_to)))
+        return moves
+
+    def is_legal(self, move):
+        """
+        Test a single move of the current player, e.g. a hash or book move, without generating the others
+        :param move: Move
+        :return: True or False
+        """
+        code = self._code_at(move.from_square.index, self.is_current_white)
+        if code is None:
+            return False
+        from_index, to_index = move.from_square.index, move.to_square.index
+        enemy = self.occupied_black if self.is_current_white else self.occupied_white
+        targets = bitboard_.piece_moves(code, from_index, self.occupied) | \
+            bitboard_.piece_attacks(code, from_index, self.occupied) & enemy
+        targets &= self._legal_mask(code, from_index, self._check_info())
+        if targets >> to_index & 1:
+            if code % bitboard_.BLACK_OFFSET == 0 and (1 << to_index) & (bitboard_.RANK_1 | bitboard_.RANK_8):
+                return move.promotion in PROMOTIONS
+            return move.promotion is None
+        return move in self._special_moves()
+
+    def is_capture(self, move):
+        """
+        :return: True if the move of the current player takes a piece, en passant included
+        """
+        to_index = move.to_square.index
+        if self.occupied >> to_index & 1:
+            return True
+        return to_index == self.en_passant_index and \
+            self.bitboards[0 if self.is_current_white else bitboard_.BLACK_OFFSET] >> move.from_square.index & 1
 
-            # Create new dictionary to populate with updated squares
-            updated_valid_squares = {direction: [] for direction in current_piece.valid_squares.keys()}
+    def iter_moves(self, hash_move=None, captures_only=False, quiet_order=None):
+        """
+        Generate the legal moves of the current player lazily, in stages: the hash move, then the captures from
+        the most valuable victim and least valuable attacker, then the quiet moves. The stages after an early
+        stop of the caller, e.g. an alpha-beta cutoff, are never generated.
+        :param hash_move: Move to try first, e.g. from the transposition table, skipped if it is not legal
+        :param captures_only: stop after the captures, for quiescence search and tactical scans
+        :param quiet_order: key function to sort the quiet moves by, highest first, generation order by default
+        :return: generator of Move
+        """
+        if hash_move is not None:
+            if self.is_legal(hash_move) and (not captures_only or self.is_capture(hash_move)):
+                yield hash_move
+            else:
+                hash_move = None
+
+        is_white = self.is_current_white
+        bb = self.bitboards
+        codes = range(bitboard_.BLACK_OFFSET) if is_white else range(bitboard_.BLACK_OFFSET, 12)
+        enemy = self.occupied_black if is_white else self.occupied_white
+        occupied = self.occupied
+        last_ranks = bitboard_.RANK_1 | bitboard_.RANK_8
+        info = self._check_info()
+
+        captures = []
+        for code in codes:
+            for index in bitboard_.iter_bits(bb[code]):
+                targets = bitboard_.piece_attacks(code, index, occupied) & enemy & self._legal_mask(code, index, info)
+                for target in bitboard_.iter_bits(targets):
+                    victim = self.board[target]
+                    captures.append((16 * _ORDER_VALUES[victim] - _ORDER_VALUES[code], index, target, code))
+        captures.sort(reverse=True)
+        for _, index, target, code in captures:
+            from_square, to_square = Square.from_index(index), Square.from_index(target)
+            if code % bitboard_.BLACK_OFFSET == 0 and (1 << target) & last_ranks:
+                for name in PROMOTIONS:
+                    move = Move(from_square, to_square, name)
+                    if move != hash_move:
+                        yield move
+            else:
+                move = Move(from_square, to_square)
+                if move != hash_move:
+                    yield move
+        for move in self._en_passant_moves():
+            if move != hash_move:
+                yield move
+        if captures_only:
+            return
 
-            for direction, squares in current_piece.valid_squares.items():
-                for square in squares:
-                    if square in occupied_squares:
-                        if current_piece.name in ["K", "N"]:  # Kings and Knights do not have obstructed trajectories
-                            pass
-                        elif current_piece.name in ["Q", "B", "R", "P"]:  # Cut trajectories for other pieces
-                            break  # stop appending after finding a blocking piece
+        quiets = self._quiet_moves(codes, info, hash_move)
+        if quiet_order is not None:
+            quiets = sorted(quiets, key=quiet_order, reverse=True)
+        yield from quiets
+
+    def _quiet_moves(self, codes, info, hash_move):
+        """Generator of the legal moves that do not capture, promotions and castling included"""
+        occupied = self.occupied
+        last_ranks = bitboard_.RANK_1 | bitboard_.RANK_8
+        for code in codes:
+            is_pawn = code % bitboard_.BLACK_OFFSET == 0
+            for index in bitboard_.iter_bits(self.bitboards[code]):
+                targets = bitboard_.piece_moves(code, index, occupied) & self._legal_mask(code, index, info)
+                from_square = Square.from_index(index)
+                for target in bitboard_.iter_bits(targets):
+                    to_square = Square.from_index(target)
+                    if is_pawn and (1 << target) & last_ranks:
+                        for name in PROMOTIONS:
+                            move = Move(from_square, to_square, name)
+                            if move != hash_move:
+                                yield move
                     else:
-                        updated_valid_squares[direction].append(square)
-
-            current_piece.valid_squares = updated_valid_squares
-
-    def update_all_attack_squares(self):
-
-        def update_attack_squares(active_attack, active_defense):
+                        move = Move(from_square, to_square)
+                        if move != hash_move:
+                            yield move
+        for move in self._castling_moves():
+            if move != hash_move:
+                yield move
+
+    def _en_passant_is_legal(self, move):
+        """
+        En passant removes two pieces from the line of the king, so it is tested by playing it
+        """
+        attack_maps, check = self._attack_maps, self._check
+        is_white = self.is_current_white
+        self.make_move(move)
+        kings = self.bitboards[5 if is_white else 11]
+        legal = not kings or not self._attackers(kings.bit_length() - 1, not is_white, self.occupied)
+        self.unmake_move()
+        self._attack_maps, self._check = attack_maps, check
+        return legal
+
+    def make_move(self, move):
+        """
+        Play a move without validating it and record it in the undo stack. Valid and attack squares are not
+        updated, the next Chess.move recomputes them, and the dead pieces lists are only kept by Chess.move.
+        :param move: Move with the squares of a piece of the current player and of its destination
+        :return: code of the captured piece, None if the destination square was empty
+        """
+        current_index, new_index = move.from_square.index, move.to_square.index
+        is_white = self.is_current_white
+        code = self.board[current_index]
+        is_pawn = code % bitboard_.BLACK_OFFSET == 0
+        captured, captured_index = self.board[new_index], new_index
+        if captured is None and is_pawn and new_index == self.en_passant_index:
+            captured_index = new_index - 8 if is_white else new_index + 8
+            captured = bitboard_.BLACK_OFFSET if is_white else 0
+        promoted = bitboard_.piece_code(move.promotion, is_white) if move.promotion else None
+
+        self._undo_stack.append((current_index, new_index, code, captured, captured_index, promoted, is_white,
+                                 self.score, self.halfmove_clock, self.castling_rights, self.en_passant_index,
+                                 False))
+
+        if captured is not None:
+            self._clear_piece(captured, captured_index)
+        self._clear_piece(code, current_index)
+        self._set_piece(code if promoted is None else promoted, new_index)
+        if code % bitboard_.BLACK_OFFSET == 5 and abs(new_index - current_index) == 2:  # Castling moves the rook
+            rook_from, rook_to = _CASTLING_ROOKS[new_index]
+            self._clear_piece(code - 2, rook_from)
+            self._set_piece(code - 2, rook_to)
+
+        if self.castling_rights:
+            rights = self.castling_rights & _CASTLING_MASKS[current_index] & _CASTLING_MASKS[new_index]
+            if rights != self.castling_rights:
+                self._set_castling_rights(rights)
+        en_passant_index = None
+        if is_pawn and abs(new_index - current_index) == 16:
+            index = (current_index + new_index) // 2
+            if self._can_take_en_passant(index, not is_white):
+                en_passant_index = index
+        if en_passant_index != self.en_passant_index:
+            self._set_en_passant(en_passant_index)
+
+        if captured is not None or is_pawn:  # Capture or pawn move
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if not is_white:
+            self.fullmove_number += 1
+        self.switch_current_player()
 
-            squares_occupied_defense = [piece.square for piece in active_defense]
+        return captured
 
-            for current_piece in active_attack:
+    def unmake_move(self):
+        """
+        Take back the last move played with Chess.make_move or Chess.move, restoring the previous position,
+        current player, score and game state fields from the undo stack
+        :return: Move that was taken back
+        """
+        current_index, new_index, code, captured, captured_index, promoted, is_current_white, score, \
+            halfmove_clock, castling_rights, en_passant_index, dead = self._undo_stack.pop()
+
+        self._clear_piece(code if promoted is None else promoted, new_index)
+        self._set_piece(code, current_index)
+        if captured is not None:
+            self._set_piece(captured, captured_index)
+            if dead:
+                (self.dead_black if is_current_white else self.dead_white).pop()
+        if code % bitboard_.BLACK_OFFSET == 5 and abs(new_index - current_index) == 2:
+            rook_from, rook_to = _CASTLING_ROOKS[new_index]
+            self._clear_piece(code - 2, rook_to)
+            self._set_piece(code - 2, rook_from)
+
+        if self.is_current_white != is_current_white:
+            self.switch_current_player()
+        if not is_current_white:
+            self.fullmove_number -= 1
+        self.score = score
+        self.halfmove_clock = halfmove_clock
+        if castling_rights != self.castling_rights:
+            self._set_castling_rights(castling_rights)
+        if en_passant_index != self.en_passant_index:
+            self._set_en_passant(en_passant_index)
+
+        promotion = bitboard_.code_name(promoted)[0] if promoted is not None else None
+        return Move(Square.from_index(current_index), Square.from_index(new_index), promotion)
+
+    def _update_moved_squares(self, *indices):
+        """
+        Incremental update of Chess.valid_moves and Chess.attack_moves after a move, recomputing only the pieces
+        on the changed squares and the pieces whose squares depend on the occupancy of the changed squares
+        :param indices: square indices changed by the move, two for most moves
+        :return: None
+        """
+        affected = 0
+        for index in indices:
+            self.valid_moves.pop(index, None)
+            self.attack_moves.pop(index, None)
+            affected |= (1 << index) | self._dependent_pieces(index)
 
-                # Compute individual valid pieces
-                # current_piece.attack_squares = current_piece.compute_valid_squares()
+        for index in bitboard_.iter_bits(affected & self.occupied):
+            self._update_piece_squares(self.board[index], index)
 
-                # Create new dictionary to populate with updated squares
-                updated_attack_squares = {direction: [] for direction in current_piece.attack_squares.keys()}
+        self._squares_current = True
+        self._view = self._piece_views = None
 
-                for direction, squares in current_piece.attack_squares.items():
-                    for square in squares:
-                        if square in squares_occupied_defense:
-                            if current_piece.name in ["K",
-                                                      "N"]:  # Kings and Knights do not have obstructed trajectories
-                                updated_attack_squares[direction].append(square)
-                            elif current_piece.name in ["Q", "B", "R", "P"]:  # Cut trajectories for other pieces
-                                updated_attack_squares[direction].append(square)
-                                break
+        if self.check_incremental:
+            assert self.valid_moves == self._compute_valid_moves(), "Incremental valid squares are out of sync"
+            assert self.attack_moves == self._compute_attack_moves(), "Incremental attack squares are out of sync"
 
-                current_piece.attack_squares = updated_attack_squares
+    def _dependent_pieces(self, index):
+        """
+        Bitboard of the pieces whose valid or attack squares change when the square index is emptied or occupied:
+        every piece reaching the square and every pawn pushing through it
+        """
+        bb = self.bitboards
+        occupied = self.occupied
+        rooks = bb[3] | bb[4] | bb[9] | bb[10]
+        bishops = bb[2] | bb[4] | bb[8] | bb[10]
+        return (bitboard_.rook_attacks(index, occupied) & rooks |
+                bitboard_.bishop_attacks(index, occupied) & bishops |
+                bitboard_.knight_attacks(index) & (bb[1] | bb[7]) |
+                bitboard_.king_attacks(index) & (bb[5] | bb[11]) |
+                (bitboard_.pawn_attacks(index, False) | bitboard_.pawn_push_sources(index, True)) & bb[0] |
+                (bitboard_.pawn_attacks(index, True) | bitboard_.pawn_push_sources(index, False)) & bb[6])
+
+    def _update_piece_squares(self, code, index):
+        defense = self.occupied_black if code < bitboard_.BLACK_OFFSET else self.occupied_white
+        self.valid_moves[index] = bitboard_.piece_moves(code, index, self.occupied)
+        self.attack_moves[index] = bitboard_.piece_attacks(code, index, self.occupied) & defense
 
-            return active_attack
+    def update_all_valid_squares(self):
+        """
+        Update the valid squares of all active pieces, stored as bitboards in Chess.valid_moves and
+        exposed as the Piece.valid_squares dictionary of the active pieces
+        :return: None
+        """
+        self.valid_moves = self._compute_valid_moves()
+        self._view = self._piece_views = None
 
-        self.active_white = update_attack_squares(self.active_white, self.active_black)
-        self.active_black = update_attack_squares(self.active_black, self.active_white)
+    def update_all_attack_squares(self):
+        """
+        Update the squares with opponent pieces that every active piece attacks, stored as bitboards in
+        Chess.attack_moves and exposed as the Piece.attack_squares dictionary of the active pieces
+        :return: None
+        """
+        self.attack_moves = self._compute_attack_moves()
+        self._view = self._piece_views = None
+
+    def _compute_valid_moves(self):
+        occupied = self.occupied
+        valid_moves = {}
+        for code, bb in enumerate(self.bitboards):
+            for index in bitboard_.iter_bits(bb):
+                # Kings and Knights do not have obstructed trajectories, rays of other pieces stop at blocking pieces
+                valid_moves[index] = bitboard_.piece_moves(code, index, occupied)
+        return valid_moves
+
+    def _compute_attack_moves(self):
+        occupied = self.occupied
+        attack_moves = {}
+        for code, bb in enumerate(self.bitboards):
+            defense = self.occupied_black if code < bitboard_.BLACK_OFFSET else self.occupied_white
+            for index in bitboard_.iter_bits(bb):
+                attack_moves[index] = bitboard_.piece_attacks(code, index, occupied) & defense
+        return attack_moves
 
     def _test_active(self):
         """
         Test that no two valid pieces have the same square
         :return: True or False
         """
-        all_active = self.active_white + self.active_black
-        all_squares = [piece.square for piece in all_active]
-
-        counts = Counter(all_squares)
-
         flag = True
 
-        for key, val in counts.items():
-            if val > 1:
-                print("ERROR: Square {} is occupied more than once".format(key), file=sys.stderr)
+        seen = 0
+        for bb in self.bitboards:
+            for index in bitboard_.iter_bits(seen & bb):
+                print("ERROR: Square {} is occupied more than once".format(Square.from_index(index)),
+                      file=sys.stderr)
                 flag = False
+            seen |= bb
+
+        white = 0
+        for bb in self.bitboards[:bitboard_.BLACK_OFFSET]:
+            white |= bb
+        if white != self.occupied_white or seen ^ white != self.occupied_black or seen != self.occupied:
+            print("ERROR: Occupancy bitboards are out of sync", file=sys.stderr)
+            flag = False
+
+        board = [None] * 64
+        for code, bb in enumerate(self.bitboards):
+            for index in bitboard_.iter_bits(bb):
+                board[index] = code
+        if board != self.board:
+            print("ERROR: Mailbox is out of sync with the bitboards", file=sys.stderr)
+            flag = False
+
         return flag
 
+    def _test_position_key(self):
+        """
+        Test that the incrementally updated Zobrist hash matches a full computation
+        :return: True or False
+        """
+        return self.position_key == zobrist_.compute_key(self.bitboards, self.is_current_white,
+                                                          self.castling_rights, self.en_passant_index)
+
     def get_active(self):
         if self.is_current_white:
             active = self.active_white
@@ -280,83 +1033,20 @@ class Chess:
             active = self.active_black
         return active
 
-    @staticmethod
-    def check_active(active, dead):
-        new_active = []
-        for piece in active:
-            if not piece.state:
-                dead.append(piece)
-            else:
-                new_active.append(piece)
-        return new_active, dead
-
     def game(self):
         """
-        Method to start the game
+        Method to start the game, the pygame front-end is only imported here
         :return: None
         """
-
-        screen = pygame.display.set_mode([SCREEN_WIDTH, SCREEN_HEIGHT])
-
-        static_sprites = pygame.sprite.Group()
-        board = BoardSprite()
-        static_sprites.add(board)
+        from src.renderer_ import Renderer
 
         self.add_piece(Piece("N", True, True, Square("e4")))
         self.add_piece(Piece("P", False, True, Square("d5")))
         self.add_piece(Piece("P", False, True, Square("f6")))
 
-        all_active = self.active_white + self.active_black
-
         self.update_all_attack_squares()
 
-        for piece in all_active:
+        for piece in self.active_white + self.active_black:
             print(piece, piece.attack_squares)
 
-        running = True
-        dragging = False
-        mouse_x, mouse_y = 0, 0
-
-        while running:
-            # Did the user click the window close button?
-            for event in pygame.event.get():
-
-                if event.type == pygame.QUIT:
-                    running = False
-
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:  # Is this left click?
-                        for piece in all_active:
-                            if piece.sprite.rect.collidepoint(event.pos):
-                                piece.sprite.dragging = True
-                                dragging = True
-
-                elif event.type == pygame.MOUSEMOTION:
-                    if dragging:
-                        for piece in all_active:
-                            if piece.sprite.dragging:
-                                mouse_xs, mouse_ys = event.pos
-                                mouse_x, mouse_y = screen_to_chess(mouse_xs, mouse_ys, SQUARE_SIZE)
-                                piece.sprite.set_square(mouse_x, mouse_y)
-
-                elif event.type == pygame.MOUSEBUTTONUP:
-                    if event.button == 1:
-                        dragging = False
-                        for piece in all_active:
-                            if piece.sprite.dragging:
-                                piece.sprite.dragging = False
-                                if not self.move(piece.square, Square((mouse_x, mouse_y))):
-                                    piece.sprite.set_square(piece.square.x, piece.square.y)
-
-            # Draw all sprites
-            for sprite in static_sprites:
-                screen.blit(sprite.surf, sprite.rect)
-
-            for piece in all_active:
-                screen.blit(piece.sprite.surf, piece.sprite.rect)
-
-            # Flip the display
-            pygame.display.flip()
-
-        # Done! Time to quit.
-        pygame.quit()
+        Renderer(self).run()
@@ -12,8 +12,10 @@ from src import *
 # Drawing window
 SCREEN_WIDTH, SCREEN_HEIGHT = 640, 640
 SQUARE_SIZE = 80
+FRAME_RATE = 60  # Maximum frames per second of the game loop
 
 # Assets
 ASSETS_FOLDER = "../assets"
 BOARD_FILE = os.path.join(ASSETS_FOLDER, "board.png")
+ATLAS_FILE = os.path.join(ASSETS_FOLDER, "PiecesArray.png")  # All pieces in one sheet, black row over white row
 
@@ -0,0 +1,234 @@
+from src import *
+from src import book_
+from src.optional_ import np, require_numpy
+
+import mmap
+import struct
+
+# Compact binary records for archives of positions and games.
+#
+# A position takes POSITION.size = 32 bytes: the occupancy bitboard, then the piece code (see
+# bitboard_.piece_code) of every occupied square from a1 to h8 as 4-bit nibbles, first square in the high
+# nibble, which fits the 32 pieces of a legal position in 16 bytes. Then one byte with the current player in
+# bit 0 and the castling rights in bits 1-4, one byte with 1 + the file of the en passant square or 0, the
+# halfmove clock (up to 255), the fullmove number (up to 65535) and 3 reserved bytes.
+#
+# A game is delta-encoded: its start position, the number of moves and every move in 16 bits as in
+# book_.encode_move, so that each later position is only the move from the previous one.
+
+POSITION = struct.Struct(">Q16sBBBH3x")
+MOVE = struct.Struct(">H")
+MAX_PIECES = 32
+
+
+def pack(chess):
+    """
+    :param chess: Chess object with at most MAX_PIECES pieces
+    :return: bytes of length POSITION.size
+    """
+    board = chess.board
+    codes = [board[index] for index in bitboard_.iter_bits(chess.occupied)]
+    if len(codes) > MAX_PIECES:
+        raise ValueError("Cannot pack {} pieces, at most {}".format(len(codes), MAX_PIECES))
+    if len(codes) % 2:
+        codes.append(0)
+    pieces = bytes([codes[i] << 4 | codes[i + 1] for i in range(0, len(codes), 2)])
+    flags = chess.is_current_white | chess.castling_rights << 1
+    en_passant = chess.en_passant_index % 8 + 1 if chess.en_passant_index is not None else 0
+    return POSITION.pack(chess.occupied, pieces, flags, en_passant, min(chess.halfmove_clock, 255),
+                         min(chess.fullmove_number, 0xFFFF))
+
+
+def unpack(data, offset=0, **kwargs):
+    """
+    Inverse of pack
+    :param data: bytes-like object, e.g. a memoryview of a mapped file
+    :param offset: position of the record in data
+    :param kwargs: other arguments of Chess
+    :return: Chess object
+    """
+    occupied, pieces, flags, en_passant, halfmove_clock, fullmove_number = POSITION.unpack_from(data, offset)
+    bitboards = [0] * 12
+    for i, index in enumerate(bitboard_.iter_bits(occupied)):
+        code = pieces[i >> 1] >> 4 if i % 2 == 0 else pieces[i >> 1] & 15
+        if code >= 12:
+            raise ValueError("Invalid piece code {} in packed position".format(code))
+        bitboards[code] |= 1 << index
+
+    chess = Chess(is_current_white=bool(flags & 1), **kwargs)
+    chess._load_bitboards(bitboards)
+    chess._set_castling_rights(flags >> 1 & 15)
+    if en_passant:
+        chess.en_passant = Square.from_index((40 if chess.is_current_white else 16) + en_passant - 1)
+    chess.halfmove_clock = halfmove_clock
+    chess.fullmove_number = fullmove_number
+    return chess
+
+
+def pack_game(moves, start=None):
+    """
+    :param moves: list of Move played from the start position
+    :param start: Chess object with the start position, the default setup if None
+    :return: bytes of length POSITION.size + 2 * (1 + number of moves)
+    """
+    start = start if start is not None else Chess(setup="default")
+    codes = [book_.encode_move(move) for move in moves]
+    return pack(start) + struct.pack(">H{}H".format(len(codes)), len(codes), *codes)
+
+
+def unpack_game(data, offset=0):
+    """
+    Inverse of pack_game
+    :return: tuple (Chess object with the start position, list of Move, offset after the game in data)
+    """
+    start = unpack(data, offset)
+    offset += POSITION.size
+    count = MOVE.unpack_from(data, offset)[0]
+    codes = struct.unpack_from(">{}H".format(count), data, offset + MOVE.size)
+    return start, [book_.decode_move(code) for code in codes], offset + MOVE.size * (count + 1)
+
+
+def game_positions(data, offset=0):
+    """
+    Replay a packed game
+    :return: generator of the Chess object after every move, the start position first; the same object is
+             yielded every time, pack or copy it to keep a position
+    """
+    chess, moves, _ = unpack_game(data, offset)
+    yield chess
+    for move in moves:
+        chess.make_move(move)
+        yield chess
+
+
+class PositionArray:
+    """
+    Packed positions in one contiguous buffer, read and written as a whole
+    """
+
+    def __init__(self, data=b""):
+        """
+        :param data: bytes-like object made of POSITION.size records
+        """
+        if len(data) % POSITION.size:
+            raise ValueError("Position data must be a multiple of {} bytes".format(POSITION.size))
+        self.data = bytearray(data)
+
+    @classmethod
+    def from_positions(cls, positions):
+        """
+        :param positions: iterable of Chess objects
+        """
+        array = cls()
+        array.extend(positions)
+        return array
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls(file.read())
+
+    def save(self, path):
+        with open(path, "wb") as output:
+            output.write(self.data)
+
+    def __len__(self):
+        return len(self.data) // POSITION.size
+
+    def __getitem__(self, i):
+        """
+        :return: Chess object of the i-th position
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Position index out of range")
+        return unpack(self.data, i * POSITION.size)
+
+    def __iter__(self):
+        view = memoryview(self.data)
+        for offset in range(0, len(view), POSITION.size):
+            yield unpack(view, offset)
+
+    def append(self, chess):
+        self.data += pack(chess)
+
+    def extend(self, positions):
+        self.data += b"".join(pack(chess) for chess in positions)
+
+    def to_numpy(self):
+        """
+        :return: decode_array of all the positions
+        """
+        require_numpy("decoding position arrays")
+        return decode_array(np.frombuffer(bytes(self.data), dtype=POSITION_DTYPE))
+
+
+class GameWriter:
+    """
+    Append packed games to a binary file
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "ab")
+        self.count = 0  # Number of written games
+
+    def write(self, moves, start=None):
+        """See pack_game"""
+        self._file.write(pack_game(moves, start))
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_games(path):
+    """
+    :param path: file written by GameWriter
+    :return: generator of tuples (Chess object with the start position, list of Move); the file is read
+             through mmap, only the pages of the games being unpacked are loaded
+    """
+    with open(path, "rb") as file:
+        size = file.seek(0, 2)
+        if not size:  # Empty files cannot be mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            while offset < size:
+                start, moves, offset = unpack_game(data, offset)
+                yield start, moves
+
+
+# Vectorized decoding, e.g. to filter an archive with batch_ before unpacking single positions
+
+POSITION_DTYPE = np.dtype([("occupied", ">u8"), ("pieces", "u1", 16), ("flags", "u1"), ("en_passant", "u1"),
+                           ("halfmove_clock", "u1"), ("fullmove_number", ">u2"), ("reserved", "u1", 3)]) \
+    if np is not None else None
+
+
+def decode_array(records):
+    """
+    Piece bitboards of many packed positions at once
+    :param records: array of POSITION_DTYPE, e.g. np.fromfile(path, dtype=POSITION_DTYPE)
+    :return: tuple (N x 12 uint64 array of bitboards, N boolean array with True if white is to move) as
+             batch_.encode
+    """
+    require_numpy("decoding position arrays")
+    shifts = np.arange(64, dtype=np.uint64)
+    occupied = (records["occupied"].astype(np.uint64)[:, None] >> shifts) & np.uint64(1) == 1
+    nibbles = np.empty((len(records), 2 * 16), dtype=np.uint8)
+    nibbles[:, 0::2] = records["pieces"] >> 4
+    nibbles[:, 1::2] = records["pieces"] & 15
+    ranks = np.maximum(np.cumsum(occupied, axis=1) - 1, 0)  # Nibble of each square
+    codes = np.where(occupied, np.take_along_axis(nibbles, ranks, axis=1), 12)
+
+    bits = np.uint64(1) << shifts
+    bitboards = np.stack([np.bitwise_or.reduce(np.where(codes == code, bits, np.uint64(0)), axis=1)
+                          for code in range(12)], axis=1)
+    return bitboards, records["flags"] & 1 == 1
@@ -0,0 +1,108 @@
+from src import *
+from src import fen_
+
+import argparse
+import json
+import re
+import time
+
+# Streaming analysis of EPD / FEN files. Every stage is a generator, so only one position is held in memory
+# at a time whatever the size of the file.
+
+_OPERATION = re.compile(r'\s*(\w+)\s*((?:"[^"]*"|[^;])*);')
+
+
+def parse_epd(line):
+    """
+    Parse one EPD or FEN line
+    :param line: string as 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 bm e5; id "test";'
+    :return: tuple (Chess object, dictionary of EPD operations with key = opcode and value = operand string)
+    """
+    fields = line.split(None, 4)
+    position, rest = fields[:4], fields[4] if len(fields) > 4 else ""
+
+    # FEN lines have the halfmove clock and fullmove number instead of operations
+    clocks = rest.split(None, 2)
+    if len(clocks) >= 2 and clocks[0].isdigit() and clocks[1].isdigit():
+        position += clocks[:2]
+        rest = clocks[2] if len(clocks) > 2 else ""
+
+    operations = {opcode: operand.strip().strip('"') for opcode, operand in _OPERATION.findall(rest)}
+    return fen_.from_fen(" ".join(position)), operations
+
+
+def read_records(lines):
+    """
+    :param lines: iterable of EPD or FEN lines, e.g. an open file
+    :return: generator of tuples (line number, Chess object, operations), skipping empty and comment lines
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            chess, operations = parse_epd(line)
+            yield number, chess, operations
+
+
+def analyze(records, depth=2, time_limit=None, table_bits=18):
+    """
+    Search every position, reusing one fixed-size transposition table
+    :param records: iterable of (line number, Chess object, operations) as yielded by read_records
+    :return: generator of result dictionaries
+    """
+    searcher = search_.Searcher(search_.TranspositionTable(table_bits))
+    for number, chess, operations in records:
+        start = time.perf_counter()
+        result = searcher.search(chess, depth=depth, time_limit=time_limit)
+        yield {
+            "line": number,
+            "fen": fen_.to_fen(chess),
+            "operations": operations,
+            "best_move": str(result.best_move) if result.best_move is not None else None,
+            "score": result.score,
+            "pv": [str(move) for move in result.pv],
+            "depth": result.depth,
+            "nodes": result.nodes,
+            "material": chess.game_score(),
+            "seconds": time.perf_counter() - start,
+        }
+
+
+def write_results(results, output):
+    """
+    Write results as JSON lines as soon as they are produced
+    :param results: iterable of dictionaries
+    :param output: open text file
+    :return: number of written results
+    """
+    count = 0
+    for result in results:
+        output.write(json.dumps(result) + "\n")
+        count += 1
+    return count
+
+
+def run(input_path, output_path, depth=2, time_limit=None):
+    """
+    Analyze an EPD or FEN file line by line into a JSON lines file
+    :return: number of analyzed positions
+    """
+    with open(input_path) as lines, open(output_path, "w") as output:
+        return write_results(analyze(read_records(lines), depth=depth, time_limit=time_limit), output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the analysis of an EPD or FEN file to JSON lines")
+    parser.add_argument("input", help="EPD or FEN file, one position per line")
+    parser.add_argument("output", help="JSON lines file for the results")
+    parser.add_argument("--depth", type=int, default=2, help="search depth in plies")
+    parser.add_argument("--time", type=float, default=None, help="search time limit per position in seconds")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = run(args.input, args.output, depth=args.depth, time_limit=args.time)
+    elapsed = time.perf_counter() - start
+    print("Analyzed {} positions in {:.2f} s".format(count, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+from src import *
+
+# Static evaluation in centipawns, positive when white is better. Chess keeps the sum of the material and
+# piece-square terms of all its pieces in Chess.evaluation, updated every time a piece is set or cleared.
+
+MATERIAL = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+MOBILITY_WEIGHT = 4  # Centipawns per valid or attack square
+
+# Piece-square tables for white, as seen on the board: first row is rank 8, last row is rank 1
+_TABLES = {
+    'P': [0, 0, 0, 0, 0, 0, 0, 0,
+          50, 50, 50, 50, 50, 50, 50, 50,
+          10, 10, 20, 30, 30, 20, 10, 10,
+          5, 5, 10, 25, 25, 10, 5, 5,
+          0, 0, 0, 20, 20, 0, 0, 0,
+          5, -5, -10, 0, 0, -10, -5, 5,
+          5, 10, 10, -20, -20, 10, 10, 5,
+          0, 0, 0, 0, 0, 0, 0, 0],
+    'N': [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20, 0, 0, 0, 0, -20, -40,
+          -30, 0, 10, 15, 15, 10, 0, -30,
+          -30, 5, 15, 20, 20, 15, 5, -30,
+          -30, 0, 15, 20, 20, 15, 0, -30,
+          -30, 5, 10, 15, 15, 10, 5, -30,
+          -40, -20, 0, 5, 5, 0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    'B': [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 10, 10, 5, 0, -10,
+          -10, 5, 5, 10, 10, 5, 5, -10,
+          -10, 0, 10, 10, 10, 10, 0, -10,
+          -10, 10, 10, 10, 10, 10, 10, -10,
+          -10, 5, 0, 0, 0, 0, 5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    'R': [0, 0, 0, 0, 0, 0, 0, 0,
+          5, 10, 10, 10, 10, 10, 10, 5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          -5, 0, 0, 0, 0, 0, 0, -5,
+          0, 0, 0, 5, 5, 0, 0, 0],
+    'Q': [-20, -10, -10, -5, -5, -10, -10, -20,
+          -10, 0, 0, 0, 0, 0, 0, -10,
+          -10, 0, 5, 5, 5, 5, 0, -10,
+          -5, 0, 5, 5, 5, 5, 0, -5,
+          0, 0, 5, 5, 5, 5, 0, -5,
+          -10, 5, 5, 5, 5, 5, 0, -10,
+          -10, 0, 5, 0, 0, 0, 0, -10,
+          -20, -10, -10, -5, -5, -10, -10, -20],
+    'K': [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+          20, 20, 0, 0, 0, 0, 20, 20,
+          20, 30, 10, 0, 0, 10, 30, 20],
+}
+
+
+def _piece_square_values(code):
+    """Signed material plus piece-square value of the piece with this code on each square index"""
+    name, is_white = bitboard_.code_name(code)
+    table = _TABLES[name]
+    if is_white:
+        return [MATERIAL[name] + table[(7 - index // 8) * 8 + index % 8] for index in range(64)]
+    return [-MATERIAL[name] - table[index] for index in range(64)]  # Black sees the board mirrored
+
+
+# Key = piece code, then square index
+PIECE_SQUARE_VALUES = [_piece_square_values(code) for code in range(12)]
+
+
+def mobility(chess):
+    """
+    Difference between the numbers of valid and attack squares of white and black, taken from the
+    already computed Chess.valid_moves and Chess.attack_moves
+    :return: integer
+    """
+    total = 0
+    for index, bb in chess.valid_moves.items():
+        count = bitboard_.popcount(bb | chess.attack_moves.get(index, 0))
+        total += count if chess.occupied_white & (1 << index) else -count
+    return total
+
+
+def evaluate(chess, use_mobility=False):
+    """
+    Evaluation of a position from the point of view of the current player, O(1) from Chess.evaluation
+    :param chess: Chess object
+    :param use_mobility: add the mobility term while the valid squares of chess match its position,
+                         as after Chess.move; it is skipped after make_move/unmake_move
+    :return: integer score in centipawns
+    """
+    score = chess.evaluation
+    if use_mobility and chess._squares_current:
+        score += MOBILITY_WEIGHT * mobility(chess)
+    return score if chess.is_current_white else -score
@@ -0,0 +1,111 @@
+from src import *
+
+import re
+
+# Forsyth-Edwards Notation of positions, e.g. DEFAULT_FEN for the starting setup
+
+DEFAULT_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+_CODES = {name: code for code, name in enumerate(bitboard_.PIECE_NAMES)}
+_CODES.update({name.lower(): code + bitboard_.BLACK_OFFSET for name, code in list(_CODES.items())})
+_LETTERS = bitboard_.PIECE_NAMES + bitboard_.PIECE_NAMES.lower()  # By piece code
+_EN_PASSANT = re.compile(r"[a-h][36]$")
+
+
+def parse_board(field):
+    """
+    Parse the piece placement field of a FEN string in a single pass
+    :param field: string as "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR"
+    :return: list of the 12 piece bitboards
+    """
+    bitboards = [0] * 12
+    ranks = field.split("/")
+    if len(ranks) != 8:
+        raise ValueError("FEN board must have 8 ranks: {}".format(field))
+
+    for row, rank in enumerate(ranks):
+        index = (7 - row) * 8  # First rank of the string is rank 8
+        end = index + 8
+        for char in rank:
+            if char.isdigit():
+                index += int(char)
+            else:
+                try:
+                    bitboards[_CODES[char]] |= 1 << index
+                except KeyError:
+                    raise ValueError("Invalid piece {} in FEN board {}".format(char, field))
+                index += 1
+        if index != end:
+            raise ValueError("FEN rank {} does not have 8 squares".format(rank))
+    return bitboards
+
+
+def from_fen(fen, **kwargs):
+    """
+    Build a game from a FEN string. The halfmove clock and fullmove number are optional, as in EPD.
+    :param fen: string as DEFAULT_FEN
+    :param kwargs: other arguments of Chess
+    :return: Chess object
+    """
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError("FEN needs at least board, side, castling and en passant fields: {}".format(fen))
+
+    if fields[1] not in ("w", "b"):
+        raise ValueError("FEN side to move must be w or b: {}".format(fields[1]))
+    if fields[2] != "-" and (not fields[2] or set(fields[2]) - set("KQkq")):
+        raise ValueError("Invalid FEN castling field {}".format(fields[2]))
+    if fields[3] != "-" and not _EN_PASSANT.match(fields[3]):
+        raise ValueError("Invalid FEN en passant square {}".format(fields[3]))
+    clocks = fields[4:6]
+    if not all(clock.isdigit() for clock in clocks):
+        raise ValueError("FEN halfmove clock and fullmove number must be integers: {}".format(" ".join(clocks)))
+
+    chess = Chess(is_current_white=fields[1] == "w", **kwargs)
+    chess._load_bitboards(parse_board(fields[0]))
+    chess.castling = fields[2]
+    chess.en_passant = Square.from_name(fields[3]) if fields[3] != "-" else None
+    if len(clocks) == 2:
+        chess.halfmove_clock = int(clocks[0])
+        chess.fullmove_number = int(clocks[1])
+    return chess
+
+
+def board_field(bitboards):
+    """
+    Piece placement field of a FEN string
+    :param bitboards: 12 piece bitboards, see Chess.bitboards
+    :return: string
+    """
+    board = [None] * 64
+    for code, bb in enumerate(bitboards):
+        for index in bitboard_.iter_bits(bb):
+            board[index] = _LETTERS[code]
+
+    ranks = []
+    for y in range(7, -1, -1):
+        rank, empty = "", 0
+        for letter in board[y * 8:y * 8 + 8]:
+            if letter is None:
+                empty += 1
+            else:
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += letter
+        ranks.append(rank + (str(empty) if empty else ""))
+    return "/".join(ranks)
+
+
+def to_fen(chess, epd=False):
+    """
+    FEN string of a game
+    :param chess: Chess object
+    :param epd: leave out the halfmove clock and fullmove number, as in the first four fields of EPD
+    :return: string
+    """
+    fields = [board_field(chess.bitboards), "w" if chess.is_current_white else "b", chess.castling or "-",
+              chess.en_passant.name if chess.en_passant is not None else "-"]
+    if not epd:
+        fields += [str(chess.halfmove_clock), str(chess.fullmove_number)]
+    return " ".join(fields)
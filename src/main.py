@@ -1,5 +1,7 @@
 from src import *
 
+import pygame
+
 # Initialize modules from pygame
 pygame.init()
 
@@ -0,0 +1,19 @@
+from src import *
+
+# Optional dependencies. numpy is only needed by the array-based code: batch_, the generation of tablebase_
+# files and encoding_.decode_array. The rules, search, GUI and probing of tablebases and books work without it.
+# It is declared in the "optional" category of the Pipfile.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def require_numpy(feature):
+    """
+    :param feature: what needs numpy, for the error message
+    :raises ImportError: if numpy is not installed
+    """
+    if np is None:
+        raise ImportError("{} needs numpy, install it with: pip install numpy".format(feature))
@@ -0,0 +1,155 @@
+from src import *
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+ParallelResult = namedtuple("ParallelResult", "best_move score pv nodes depth worker_nodes elapsed")
+
+_worker_searcher = None  # Searcher of each worker process, its transposition table is kept between tasks
+
+_INFINITY = search_.MATE_SCORE + 1
+
+
+def _init_worker(table_bits):
+    global _worker_searcher
+    _worker_searcher = search_.Searcher(search_.TranspositionTable(table_bits))
+
+
+def _search_root_move(state, move, depth, deadline, alpha=-_INFINITY, beta=_INFINITY):
+    """
+    Worker task: search the position after one root move
+    :param state: output of Chess.get_state
+    :param deadline: time.time() after which the task gives up, None for no limit
+    :param alpha: lower bound of the window of the root player, a score not above it is an upper bound
+    :param beta: upper bound of the window of the root player, a score not below it is a lower bound
+    :return: tuple (move, score for the root player, pv, nodes, completed, process id)
+    """
+    chess = Chess.from_state(state)
+    chess.make_move(move)
+    if depth == 0:
+        return move, -_worker_searcher.quiesce(chess), [move], 1, True, os.getpid()
+
+    time_limit = None
+    if deadline is not None:
+        time_limit = deadline - time.time()
+        if time_limit <= 0:
+            return move, 0, [move], 0, False, os.getpid()
+
+    result = _worker_searcher.search(chess, depth=depth, time_limit=time_limit, alpha=-beta, beta=-alpha)
+    completed = result.depth == depth or abs(result.score) > search_.MATE_BOUND
+    return move, -result.score, [move] + result.pv, result.nodes, completed, os.getpid()
+
+
+class ParallelSearcher:
+    """
+    Search that splits the root moves across a pool of worker processes. Every iteration of the iterative
+    deepening sends the compact state of the position and one root move per task.
+
+    Root moves are searched as in principal variation search, following Young Brothers Wait: the first move
+    alone with a full window, which gives alpha, then all the other moves in parallel with a null window
+    (alpha, alpha + 1) that only tests whether they beat it. Only the moves that fail high are searched again
+    with the window (alpha, infinity), so most of the alpha-beta pruning of a sequential search is kept.
+    """
+
+    def __init__(self, workers=None, table_bits=18):
+        """
+        :param workers: number of processes, os.cpu_count() by default
+        :param table_bits: size of the transposition table of each worker, see TranspositionTable
+        """
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(table_bits,))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def search(self, position, depth=None, time_limit=None):
+        """
+        Search the best move of the current player
+        :param position: Chess object, left unchanged
+        :param depth: maximum depth in plies, search_.DEFAULT_DEPTH if neither depth nor time_limit is given
+        :param time_limit: maximum time in seconds, the result of the last completed iteration is returned
+        :return: ParallelResult, like search_.SearchResult plus the nodes searched by each worker process id
+                 and the elapsed time in seconds
+        """
+        start = time.time()
+        if depth is None:
+            depth = search_.MAX_DEPTH if time_limit is not None else search_.DEFAULT_DEPTH
+        deadline = start + time_limit if time_limit is not None else None
+
+        state = position.get_state()
+        moves = position.generate_moves()
+        worker_nodes = {}
+        result = ParallelResult(moves[0] if moves else None, 0, moves[:1], 0, 0, worker_nodes, 0.0)
+
+        for current_depth in range(1, depth + 1):
+            if not moves:
+                break
+            move, score, pv, nodes, completed, pid = self.executor.submit(
+                _search_root_move, state, moves[0], current_depth - 1, deadline).result()
+            worker_nodes[pid] = worker_nodes.get(pid, 0) + nodes
+            best = move, score, pv
+            alpha = score
+
+            # Key = future, value = True for a full window search, False for a null window test
+            pending = {self.executor.submit(_search_root_move, state, move, current_depth - 1, deadline,
+                                            alpha, alpha + 1): False for move in moves[1:]} if completed else {}
+            while pending:
+                done_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    full_window = pending.pop(future)
+                    move, score, pv, nodes, done, pid = future.result()
+                    worker_nodes[pid] = worker_nodes.get(pid, 0) + nodes
+                    completed = completed and done
+                    if not done or score <= alpha:  # Not better than the best move, alpha may have risen since
+                        continue
+                    if full_window:
+                        best, alpha = (move, score, pv), score
+                    else:  # Fail high: search again for the exact score
+                        pending[self.executor.submit(_search_root_move, state, move, current_depth - 1, deadline,
+                                                     alpha, _INFINITY)] = True
+
+            if not completed:
+                break
+            result = result._replace(best_move=best[0], score=best[1], pv=best[2], depth=current_depth)
+
+            # Search the best move first in the next iteration
+            moves.remove(best[0])
+            moves.insert(0, best[0])
+            if abs(best[1]) > search_.MATE_BOUND:
+                break
+
+        return result._replace(nodes=sum(worker_nodes.values()), elapsed=time.time() - start)
+
+
+def measure_speedup(position, depth, workers=None):
+    """
+    Compare a single-core search with a parallel search of the same position and depth
+    :return: Dictionary with the elapsed times, nodes, nodes per second, per-worker nodes, speedup, and the node
+             overhead of the parallel search, its nodes divided by the single-core nodes
+    """
+    start = time.time()
+    single = search_.search(position, depth=depth)
+    single_elapsed = time.time() - start
+
+    with ParallelSearcher(workers) as searcher:
+        searcher.search(position, depth=1)  # Start the worker processes before timing
+        parallel = searcher.search(position, depth=depth)
+
+    return {
+        "single_elapsed": single_elapsed,
+        "single_nodes": single.nodes,
+        "single_nodes_per_second": single.nodes / single_elapsed if single_elapsed > 0 else 0.0,
+        "parallel_elapsed": parallel.elapsed,
+        "parallel_nodes": parallel.nodes,
+        "parallel_nodes_per_second": parallel.nodes / parallel.elapsed if parallel.elapsed > 0 else 0.0,
+        "worker_nodes": parallel.worker_nodes,
+        "speedup": single_elapsed / parallel.elapsed if parallel.elapsed > 0 else 0.0,
+        "node_overhead": parallel.nodes / single.nodes if single.nodes else 0.0,
+    }
@@ -0,0 +1,111 @@
+from src import *
+
+import argparse
+import time
+
+# FEN of the known positions other than the default setup, with castling, en passant, promotions and pins
+KNOWN_FENS = {
+    "kiwipete": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "endgame": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "promotions": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+}
+
+# Known leaf node counts of legal moves, key = name of the position, then depth
+KNOWN_NODES = {
+    "default": {1: 20, 2: 400, 3: 8902, 4: 197281},
+    "kiwipete": {1: 48, 2: 2039, 3: 97862},
+    "endgame": {1: 14, 2: 191, 3: 2812, 4: 43238},
+    "promotions": {1: 6, 2: 264, 3: 9467},
+}
+
+
+def perft(chess, depth):
+    """
+    Count the leaf nodes of the move tree of a position to a given depth
+    :param chess: Chess object, left unchanged on return
+    :param depth: number of plies
+    :return: integer number of nodes
+    """
+    if depth == 0:
+        return 1
+
+    moves = chess.generate_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        chess.make_move(move)
+        nodes += perft(chess, depth - 1)
+        chess.unmake_move()
+    return nodes
+
+
+def divide(chess, depth):
+    """
+    Perft broken down by the first move
+    :return: Dictionary with key = Move and value = number of nodes after that move
+    """
+    counts = {}
+    for move in chess.generate_moves():
+        chess.make_move(move)
+        counts[move] = perft(chess, depth - 1)
+        chess.unmake_move()
+    return counts
+
+
+def position(moves=(), fen=None):
+    """
+    Chess game after a sequence of moves
+    :param moves: iterable of moves in coordinate notation, e.g. ["e2e4", "e7e5"]
+    :param fen: FEN string of the starting position, the default setup if None
+    :return: Chess object
+    """
+    chess = fen_.from_fen(fen) if fen is not None else Chess(setup="default")
+    for text in moves:
+        chess.make_move(Move.from_string(text))
+    return chess
+
+
+def check_known(name="default", max_depth=3):
+    """
+    Compare perft of a known position against its reference node counts
+    :return: Dictionary with key = depth and value = (expected, counted)
+    """
+    results = {}
+    for depth, expected in sorted(KNOWN_NODES[name].items()):
+        if depth <= max_depth:
+            chess = fen_.from_fen(KNOWN_FENS[name]) if name in KNOWN_FENS else position()
+            results[depth] = expected, perft(chess, depth)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the leaf nodes of the move tree of a position")
+    parser.add_argument("depth", type=int)
+    parser.add_argument("moves", nargs="*", help="moves from the starting position, e.g. e2e4 e7e5")
+    parser.add_argument("--fen", default=None, help="FEN of the starting position, the default setup if left out")
+    parser.add_argument("--divide", action="store_true", help="print the node count after each first move")
+    args = parser.parse_args()
+
+    try:
+        chess = position(args.moves, args.fen)
+    except ValueError as error:
+        parser.error(str(error))
+
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(chess, args.depth)
+        for move in sorted(counts, key=str):
+            print("{}: {}".format(move, counts[move]))
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(chess, args.depth)
+    elapsed = time.perf_counter() - start
+
+    print("Nodes: {}".format(nodes))
+    print("Time: {:.3f} s, {:.0f} nodes/s".format(elapsed, nodes / elapsed if elapsed > 0 else 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+from src import *
+from src import fen_
+
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Streaming replay of PGN archives. Games are read one at a time by a generator, sent to the worker processes
+# in small batches, and only a bounded number of batches is in flight, so memory does not grow with the size
+# of the archive.
+
+Game = namedtuple("Game", "headers moves result")  # Moves in SAN, e.g. ["e4", "e5", "Nf3"]
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+_HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, variation brackets, NAGs, move numbers and any other token of the movetext
+_TOKEN = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|\d+\.+|[^\s{}();]+')
+_SAN = re.compile(r'([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?[+#]?[!?]*$')
+_CASTLING_SAN = re.compile(r'([O0])-\1(-\1)?[+#]?[!?]*$')
+
+
+def read_games(lines):
+    """
+    Read the games of a PGN file lazily, keeping only the current game in memory. Comments, variations and
+    numeric annotation glyphs are skipped.
+    :param lines: iterable of lines, e.g. an open file
+    :return: generator of Game
+    """
+    headers, moves = {}, []
+    in_comment, variation_depth = False, 0
+
+    for line in lines:
+        if in_comment:  # Comment in braces spanning several lines
+            end = line.find("}")
+            if end < 0:
+                continue
+            line, in_comment = line[end + 1:], False
+
+        line = line.strip()
+        if not line or line.startswith("%"):
+            continue
+        if line.startswith("[") and not variation_depth:
+            if moves:  # Game without a result token at the end of its movetext
+                yield Game(headers, moves, headers.get("Result", "*"))
+                headers, moves = {}, []
+            match = _HEADER.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2)
+            continue
+
+        for token in _TOKEN.findall(line):
+            first = token[0]
+            if first == "{":
+                in_comment = not token.endswith("}")
+            elif first == "(":
+                variation_depth += 1
+            elif first == ")":
+                variation_depth -= 1
+            elif variation_depth or first in ";$" or first.isdigit() and token.endswith("."):
+                continue
+            elif token in RESULTS:
+                yield Game(headers, moves, token)
+                headers, moves = {}, []
+            else:
+                moves.append(token)
+
+    if moves or headers:
+        yield Game(headers, moves, headers.get("Result", "*"))
+
+
+def resolve_san(chess, san):
+    """
+    Find the move of the current player written in Standard Algebraic Notation
+    :param chess: Chess object
+    :param san: string as "e4", "Nbd7", "exd5", "e8=Q+" or "O-O"
+    :return: Move
+    :raises ValueError: if no legal move or more than one matches
+    """
+    is_white = chess.is_current_white
+    castling = _CASTLING_SAN.match(san)
+    if castling:
+        king_from = 4 if is_white else 60
+        name, from_file, from_rank = "K", None, None
+        to_index, promotion = king_from - 2 if castling.group(2) else king_from + 2, None
+    else:
+        match = _SAN.match(san)
+        if not match:
+            raise ValueError("Invalid SAN move {}".format(san))
+        name, from_file, from_rank, to_name, promotion = match.groups()
+        name = name or "P"
+        to_index = Square.from_name(to_name).index
+
+    pieces = chess.bitboards[bitboard_.piece_code(name, is_white)]
+    candidates = []
+    for move in chess.generate_moves():
+        from_square = move.from_square
+        if move.to_square.index == to_index and move.promotion == promotion and \
+                pieces >> from_square.index & 1 and \
+                (from_file is None or from_square.file == from_file) and \
+                (from_rank is None or from_square.rank == from_rank):
+            candidates.append(move)
+
+    if len(candidates) != 1:
+        raise ValueError("{} move {} in {}".format("Ambiguous" if candidates else "No", san, fen_.to_fen(chess)))
+    return candidates[0]
+
+
+def replay(game):
+    """
+    Play all the moves of a game, from the FEN header if there is one
+    :param game: Game
+    :return: dictionary with the number of played plies, captures, promotions and castlings, the final
+             material score and the error message of the first move that could not be played, None if all were
+    """
+    fen = game.headers.get("FEN")
+    chess = fen_.from_fen(fen) if fen else Chess(setup="default")
+    stats = {"plies": 0, "captures": 0, "promotions": 0, "castlings": 0, "score": 0, "error": None}
+    for san in game.moves:
+        try:
+            move = resolve_san(chess, san)
+        except ValueError as error:
+            stats["error"] = str(error)
+            break
+        if chess.make_move(move) is not None:
+            stats["captures"] += 1
+        stats["plies"] += 1
+        stats["promotions"] += move.promotion is not None
+        stats["castlings"] += san[0] in "O0"
+    stats["score"] = chess.game_score()
+    return stats
+
+
+def _replay_batch(games):
+    """
+    Worker task: replay a batch of games
+    :return: tuple (number of games, number of plies, list of error messages, Counter of results)
+    """
+    plies, errors, results = 0, [], Counter()
+    for game in games:
+        stats = replay(game)
+        plies += stats["plies"]
+        results[game.result] += 1
+        if stats["error"] is not None:
+            errors.append(stats["error"])
+    return len(games), plies, errors, results
+
+
+def _batches(games, size):
+    batch = []
+    for game in games:
+        batch.append(game)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def replay_games(games, workers=None, batch_size=64, max_pending=None):
+    """
+    Replay games over a pool of worker processes, reading them only as fast as the workers replay them
+    :param games: iterable of Game, e.g. read_games of an open file
+    :param workers: number of processes, os.cpu_count() by default, 0 to replay in this process
+    :param batch_size: number of games sent in every task
+    :param max_pending: maximum number of tasks in flight, four per worker by default
+    :return: dictionary with the numbers of games, positions and errors, the first errors, the Counter of
+             results, the elapsed time, and the games and positions per second
+    """
+    start = time.perf_counter()
+    totals = {"games": 0, "positions": 0, "errors": 0, "first_errors": [], "results": Counter()}
+
+    def add(batch_result):
+        count, plies, errors, results = batch_result
+        totals["games"] += count
+        totals["positions"] += plies
+        totals["errors"] += len(errors)
+        totals["first_errors"].extend(errors[:10 - len(totals["first_errors"])])
+        totals["results"].update(results)
+
+    if workers == 0:
+        for batch in _batches(games, batch_size):
+            add(_replay_batch(batch))
+    else:
+        workers = workers or os.cpu_count()
+        max_pending = max_pending or 4 * workers
+        with ProcessPoolExecutor(workers) as executor:
+            pending = set()
+            for batch in _batches(games, batch_size):
+                pending.add(executor.submit(_replay_batch, batch))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        add(future.result())
+            for future in pending:
+                add(future.result())
+
+    elapsed = time.perf_counter() - start
+    totals["elapsed"] = elapsed
+    totals["games_per_second"] = totals["games"] / elapsed if elapsed > 0 else 0.0
+    totals["positions_per_second"] = totals["positions"] / elapsed if elapsed > 0 else 0.0
+    return totals
+
+
+def replay_file(path, workers=None, batch_size=64):
+    """
+    Replay all the games of a PGN file, see replay_games
+    :return: dictionary of totals
+    """
+    with open(path, encoding="utf-8", errors="replace") as lines:
+        return replay_games(read_games(lines), workers=workers, batch_size=batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the games of a PGN archive")
+    parser.add_argument("input", help="PGN file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, 0 to replay in this process")
+    parser.add_argument("--batch", type=int, default=64, help="games per task")
+    args = parser.parse_args()
+
+    totals = replay_file(args.input, workers=args.workers, batch_size=args.batch)
+    print("Games: {}, positions: {}, errors: {}".format(totals["games"], totals["positions"], totals["errors"]))
+    for error in totals["first_errors"]:
+        print("  " + error)
+    print("Results: " + ", ".join("{} {}".format(result, count) for result, count in totals["results"].items()))
+    print("Time: {:.2f} s, {:.0f} games/s, {:.0f} positions/s".format(
+        totals["elapsed"], totals["games_per_second"], totals["positions_per_second"]))
+
+
+if __name__ == "__main__":
+    main()
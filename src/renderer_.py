@@ -0,0 +1,154 @@
+from src import *
+from src import chess_
+from src.sprites_ import BoardSprite, screen_to_chess, chess_to_screen, load_atlas
+
+import pygame
+
+
+class Renderer:
+    """
+    Pygame front-end of a Chess game. Pieces get their sprites only when the renderer attaches to the game.
+    Only the squares marked as dirty are redrawn and updated on screen, and the loop blocks while there is no input.
+    """
+
+    def __init__(self, chess, use_atlas=False, frame_rate=FRAME_RATE):
+        """
+        :param chess: Chess object to display
+        :param use_atlas: slice all piece images from the atlas file in a single load
+        :param frame_rate: maximum frames per second
+        """
+        self.chess = chess
+        self.use_atlas = use_atlas
+        self.frame_rate = frame_rate
+        self.static_sprites = pygame.sprite.Group()
+        self.pieces = []
+        self.dirty = []  # Screen rectangles to redraw in the next frame
+
+    def attach(self):
+        """
+        Attach sprites to the active pieces of the game, needed again after every move since the
+        pieces are views rebuilt from the position
+        :return: list of active pieces
+        """
+        self.pieces = self.chess.active_white + self.chess.active_black
+        for piece in self.pieces:
+            if piece.sprite is None:
+                piece.attach_sprite()
+        return self.pieces
+
+    def mark_dirty(self, rect):
+        """Redraw a screen rectangle in the next frame"""
+        self.dirty.append(pygame.Rect(rect))
+
+    def mark_square_dirty(self, x, y):
+        """Redraw the board square with chess coordinates (x,y) in the next frame, e.g. for moves or highlights"""
+        xs, ys = chess_to_screen(x, y, square_size=SQUARE_SIZE)
+        rect = pygame.Rect(0, 0, SQUARE_SIZE, SQUARE_SIZE)
+        rect.center = (xs, ys)
+        self.dirty.append(rect)
+
+    def mark_move_dirty(self):
+        """
+        Redraw the squares changed by the last move: its origin and destination, the square of a pawn taken en
+        passant and the rook squares of a castling
+        """
+        current_index, new_index, code, _, captured_index = self.chess._undo_stack[-1][:5]
+        indices = {current_index, new_index, captured_index}
+        if code % bitboard_.BLACK_OFFSET == 5 and abs(new_index - current_index) == 2:
+            indices.update(chess_._CASTLING_ROOKS[new_index])
+        for index in indices:
+            self.mark_square_dirty(index % 8, index // 8)
+
+    def draw(self, screen, rect=None):
+        """
+        Draw the board and the pieces, clipped to a rectangle
+        :param rect: screen rectangle, None for the full screen
+        :return: None
+        """
+        screen.set_clip(rect)
+        for sprite in self.static_sprites:
+            screen.blit(sprite.surf, sprite.rect)
+
+        # Dragged pieces go on top of the others
+        for piece in sorted(self.pieces, key=lambda p: p.sprite.dragging):
+            if rect is None or piece.sprite.rect.colliderect(rect):
+                screen.blit(piece.sprite.surf, piece.sprite.rect)
+        screen.set_clip(None)
+
+    def draw_dirty(self, screen):
+        """Redraw and update on screen only the dirty rectangles"""
+        for rect in self.dirty:
+            self.draw(screen, rect)
+        pygame.display.update(self.dirty)
+        self.dirty = []
+
+    def run(self):
+        """
+        Game loop, runs until the window is closed
+        :return: None
+        """
+        screen = pygame.display.set_mode([SCREEN_WIDTH, SCREEN_HEIGHT])
+        if self.use_atlas:
+            load_atlas()  # After set_mode, so that surfaces are converted to the display format
+
+        board = BoardSprite()
+        self.static_sprites.add(board)
+
+        self.attach()
+
+        self.draw(screen)
+        pygame.display.flip()
+
+        clock = pygame.time.Clock()
+
+        running = True
+        dragged = None  # Piece following the mouse
+        mouse_x, mouse_y = 0, 0
+
+        while running:
+            events = pygame.event.get()
+            if not events and not self.dirty:
+                events = [pygame.event.wait()]  # Nothing to do, block until the next input
+
+            for event in events:
+
+                # Did the user click the window close button?
+                if event.type == pygame.QUIT:
+                    running = False
+
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.button == 1:  # Is this left click?
+                        mouse_x, mouse_y = screen_to_chess(*event.pos, SQUARE_SIZE)
+                        if -1 < mouse_x < 8 and -1 < mouse_y < 8:
+                            dragged = self.chess.piece_at(Square.from_xy(mouse_x, mouse_y, validate=False))
+                            if dragged is not None:
+                                dragged.sprite.dragging = True
+
+                elif event.type == pygame.MOUSEMOTION:
+                    if dragged is not None:
+                        mouse_x, mouse_y = screen_to_chess(*event.pos, SQUARE_SIZE)
+                        if (mouse_x, mouse_y) != (dragged.sprite.x, dragged.sprite.y):
+                            self.mark_dirty(dragged.sprite.rect)
+                            dragged.sprite.set_square(mouse_x, mouse_y)
+                            self.mark_dirty(dragged.sprite.rect)
+
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    if event.button == 1 and dragged is not None:
+                        dragged.sprite.dragging = False
+                        self.mark_dirty(dragged.sprite.rect)
+                        self.mark_square_dirty(dragged.square.x, dragged.square.y)
+                        if -1 < mouse_x < 8 and -1 < mouse_y < 8 and \
+                                self.chess.move(dragged.square, Square.from_xy(mouse_x, mouse_y, validate=False)):
+                            self.mark_move_dirty()
+                        else:
+                            dragged.sprite.set_square(dragged.square.x, dragged.square.y)
+                        dragged = None
+                        self.attach()
+
+            if self.dirty:
+                self.draw_dirty(screen)
+
+            clock.tick(self.frame_rate)  # Frame cap
+
+        # Done! Time to quit.
+        pygame.quit()
@@ -0,0 +1,328 @@
+from src import *
+
+import time
+
+SearchResult = namedtuple("SearchResult", "best_move score pv nodes depth")
+
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 1000  # Scores above it are mates, stored in the table relative to the node
+MAX_DEPTH = 64
+DEFAULT_DEPTH = 4
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+# Measured memory of a stored entry: the tuple, its 64-bit key and Move, and the slot in the table list
+ENTRY_BYTES = 152
+
+# Chess.iter_moves gives the hash move, then captures by most valuable victim / least valuable attacker, then
+# quiet moves ordered with this score for killer moves, above any history score
+_KILLER_SCORE = 1 << 27
+
+# Piece values in centipawns by piece code for the static exchange evaluation, see evaluation_.MATERIAL
+_SEE_VALUES = [100, 320, 330, 500, 900, 20000] * 2
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table of search results indexed by Chess.position_key.
+    An entry is replaced when the new result is at least as deep or the stored one is from an older search.
+    """
+
+    def __init__(self, size_bits=20):
+        """
+        :param size_bits: the table holds 2 ** size_bits entries
+        """
+        self.mask = (1 << size_bits) - 1
+        self.entries = [None] * (1 << size_bits)
+        self.generation = 0
+
+    def new_search(self):
+        """Age all entries, so that results of previous searches are replaced first"""
+        self.generation += 1
+
+    def probe(self, key):
+        """
+        :return: tuple (key, depth, score, flag, move, generation) or None if the position is not stored
+        """
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[5] != self.generation or depth >= entry[1] or entry[0] == key:
+            self.entries[index] = (key, depth, score, flag, move, self.generation)
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+
+
+class Searcher:
+    """
+    Negamax alpha-beta search with iterative deepening over the Chess move generator
+    """
+
+    def __init__(self, table=None, use_see=True, tablebases=None):
+        """
+        :param table: TranspositionTable shared between searches, a new one by default
+        :param use_see: skip the captures that lose material by static exchange evaluation in quiescence search
+        :param tablebases: tablebase_.Tablebases giving the exact score of the endgames it covers, None to search
+        """
+        self.table = table if table is not None else TranspositionTable()
+        self.use_see = use_see
+        self.tablebases = tablebases
+        self.nodes = 0
+        self.quiescence_nodes = 0  # Part of the nodes searched by Searcher._quiescence
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = [0] * (64 * 64)  # Key = 64 * from index + to index
+        self.deadline = None  # Can be set by another thread during a search, e.g. when pondering ends
+        self.stop_event = None
+
+    def search(self, position, depth=None, time_limit=None, stop_event=None, callback=None,
+               alpha=-MATE_SCORE - 1, beta=MATE_SCORE + 1):
+        """
+        Search the best move of the current player
+        :param position: Chess object, left unchanged on return
+        :param depth: maximum depth in plies, DEFAULT_DEPTH if neither depth nor time_limit is given
+        :param time_limit: maximum time in seconds, the result of the last completed iteration is returned
+        :param stop_event: threading.Event set by another thread to end the search as with the time limit
+        :param callback: function called with the SearchResult of every completed iteration
+        :param alpha: lower bound of the search window, scores are exact only inside the window: a score not
+                      above alpha is an upper bound and a score not below beta a lower bound
+        :param beta: upper bound of the search window, e.g. alpha + 1 to only test whether a move beats alpha
+        :return: SearchResult with the best move (None without moves), score for the current player,
+                 principal variation as a list of moves, searched nodes and completed depth
+        """
+        if depth is None:
+            depth = MAX_DEPTH if time_limit is not None else DEFAULT_DEPTH
+        self.deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        self.stop_event = stop_event
+        self.nodes = self.quiescence_nodes = 0
+        self.table.new_search()
+
+        result = SearchResult(None, 0, [], 0, 0)
+        undo_depth = len(position._undo_stack)
+        for current_depth in range(1, depth + 1):
+            try:
+                score, pv = self._negamax(position, current_depth, alpha, beta, 0)
+            except _SearchTimeout:
+                while len(position._undo_stack) > undo_depth:  # Take back the moves of the interrupted line
+                    position.unmake_move()
+                break
+            result = SearchResult(pv[0] if pv else None, score, pv, self.nodes, current_depth)
+            if callback is not None:
+                callback(result)
+            if abs(score) > MATE_BOUND:
+                break  # Forced mate found, deeper iterations cannot improve it
+
+        if result.best_move is None:  # Not even the first iteration completed in time
+            moves = position.generate_moves()
+            if moves:
+                result = result._replace(best_move=moves[0], pv=[moves[0]])
+
+        return result._replace(nodes=self.nodes)
+
+    def _should_stop(self):
+        """Checked every 256 nodes"""
+        return self.deadline is not None and time.perf_counter() > self.deadline or \
+            self.stop_event is not None and self.stop_event.is_set()
+
+    def _quiet_order(self, ply):
+        """Key function of the quiet moves for Chess.iter_moves: killer moves first, then by history"""
+        killers = self.killers[ply]
+        history = self.history
+
+        def key(move):
+            if move == killers[0] or move == killers[1]:
+                return _KILLER_SCORE
+            return history[64 * move.from_square.index + move.to_square.index]
+
+        return key
+
+    def _negamax(self, position, depth, alpha, beta, ply):
+        """
+        :return: tuple (score for the current player, principal variation)
+        """
+        if self.tablebases is not None and ply > 0:
+            result = self.tablebases.probe(position)
+            if result is not None:
+                self.nodes += 1
+                outcome, plies = result
+                return outcome * (MATE_SCORE - ply - plies), []
+
+        if depth == 0:
+            return self._quiescence(position, alpha, beta, ply)
+
+        self.nodes += 1
+        if self.nodes & 255 == 0 and self._should_stop():
+            raise _SearchTimeout()
+
+        key = position.position_key
+        hash_move = None
+        entry = self.table.probe(key)
+        if entry is not None:
+            hash_move = entry[4]
+            if entry[1] >= depth and ply > 0:
+                score = _score_from_table(entry[2], ply)
+                flag = entry[3]
+                if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                    return score, [hash_move] if hash_move is not None else []
+
+        alpha_start = alpha
+        best_score, best_move, best_pv = -MATE_SCORE - 1, None, []
+
+        for move in position.iter_moves(hash_move, quiet_order=self._quiet_order(ply)):
+            position.make_move(move)
+            score, pv = self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            score = -score
+            position.unmake_move()
+
+            if score > best_score:
+                best_score, best_move, best_pv = score, move, [move] + pv
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not position.is_capture(move):  # Quiet move caused the cutoff
+                            killers = self.killers[ply]
+                            if move != killers[0]:
+                                killers[1], killers[0] = killers[0], move
+                            self.history[64 * move.from_square.index + move.to_square.index] += depth * depth
+                        break
+
+        if best_move is None:  # Checkmate or stalemate
+            return (-MATE_SCORE + ply if position.in_check() else 0), []
+
+        if best_score <= alpha_start:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(key, depth, _score_to_table(best_score, ply), flag, best_move)
+
+        return best_score, best_pv
+
+    def quiesce(self, position):
+        """
+        Score of a position after resolving its captures, with a full window
+        :return: integer score for the current player
+        """
+        return self._quiescence(position, -MATE_SCORE - 1, MATE_SCORE + 1, 0)[0]
+
+    def _quiescence(self, position, alpha, beta, ply):
+        """
+        Search only captures until the position is quiet, so that the static evaluation is not taken in the
+        middle of an exchange. The current player can stand pat on the static evaluation, except in check where
+        all evasions are searched.
+        :return: tuple (score for the current player, principal variation)
+        """
+        self.nodes += 1
+        self.quiescence_nodes += 1
+        if self.nodes & 255 == 0 and self._should_stop():
+            raise _SearchTimeout()
+
+        in_check = position.in_check()
+        best_score, best_pv = -MATE_SCORE + ply, []
+        if not in_check:
+            best_score = evaluation_.evaluate(position)
+            if best_score >= beta or ply >= MAX_DEPTH:
+                return best_score, []
+            alpha = max(alpha, best_score)
+
+        for move in position.iter_moves(captures_only=not in_check):
+            if not in_check and self.use_see and see(position, move) < 0:
+                continue  # Losing capture
+            position.make_move(move)
+            score, pv = self._quiescence(position, -beta, -alpha, ply + 1)
+            score = -score
+            position.unmake_move()
+
+            if score > best_score:
+                best_score, best_pv = score, [move] + pv
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        return best_score, best_pv
+
+
+def see(position, move):
+    """
+    Static exchange evaluation of a capture: material balance of the sequence of captures on its target square
+    in which each side takes with its least valuable attacker, and can stop when taking back loses material.
+    Attackers hidden behind other attackers join the sequence as the square is uncovered.
+    :param position: Chess object
+    :param move: capture of the current player
+    :return: centipawns won by the current player, negative for a losing capture
+    """
+    from_index, to_index = move.from_square.index, move.to_square.index
+    is_white = position.is_current_white
+    bitboards = position.bitboards
+    attacker = position.board[from_index]
+    occupied = position.occupied ^ (1 << from_index)
+
+    victim = position.board[to_index]
+    if victim is None:  # En passant
+        victim = bitboard_.BLACK_OFFSET if is_white else 0
+        occupied ^= 1 << (to_index - 8 if is_white else to_index + 8)
+    gains = [_SEE_VALUES[victim]]
+    value = _SEE_VALUES[attacker]
+
+    side = not is_white
+    while True:
+        own = position.occupied_white if side else position.occupied_black
+        attackers = position._attackers(to_index, side, occupied) & occupied & own
+        if not attackers:
+            break
+        offset = 0 if side else bitboard_.BLACK_OFFSET
+        for code in range(offset, offset + 6):  # Least valuable attacker
+            pieces = attackers & bitboards[code]
+            if pieces:
+                break
+        gains.append(value - gains[-1])
+        if gains[-1] < -gains[-2]:  # Not capturing is better even if the capture is not taken back
+            gains.pop()
+            break
+        value = _SEE_VALUES[code]
+        occupied ^= pieces & -pieces
+        side = not side
+
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def _score_to_table(score, ply):
+    """Mate scores are stored as distance to mate from the node, not from the root"""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def search(position, depth=None, time_limit=None, table=None):
+    """
+    Search the best move of the current player, see Searcher.search
+    :param position: Chess object
+    :param depth: maximum depth in plies
+    :param time_limit: maximum time in seconds
+    :param table: TranspositionTable to reuse between calls
+    :return: SearchResult
+    """
+    return Searcher(table).search(position, depth=depth, time_limit=time_limit)
@@ -0,0 +1,396 @@
+from src import *
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from itertools import count
+
+# Game server: one asyncio process hosts many headless games over TCP. Requests and responses are JSON objects,
+# one per line, e.g.
+#   {"op": "new"}                                 -> {"ok": true, "game": 1, "fen": "...", "status": "ongoing"}
+#   {"op": "move", "game": 1, "move": "e2e4"}     -> {"ok": true, "game": 1, "fen": "...", "status": "ongoing"}
+#   {"op": "state", "game": 1}, {"op": "close", "game": 1}, {"op": "stats"}
+# An "id" field is copied to the response, and "legal": true adds the legal moves of the position to it.
+# Errors are answered with {"ok": false, "error": "..."}. Changed sessions are appended to a JSON lines file in
+# batches. Sessions idle for too long are evicted, and read back from the file on their next request, also after
+# a restart of the server; new games get ids after those of the file.
+
+DEFAULT_PORT = 8765
+
+
+class Session:
+    """
+    One game hosted by the server
+    """
+    __slots__ = ("game_id", "chess", "moves", "last_active", "dirty")
+
+    def __init__(self, game_id, chess):
+        self.game_id = game_id
+        self.chess = chess
+        self.moves = []  # Played moves in coordinate notation
+        self.last_active = time.monotonic()
+        self.dirty = True  # Changed since it was last persisted
+
+    def status(self, moves=None):
+        """
+        :param moves: legal moves of the position when already generated
+        :return: "ongoing", "checkmate", "stalemate" or "draw" by the fifty-move rule
+        """
+        chess = self.chess
+        has_moves = bool(moves) if moves is not None else next(chess.iter_moves(), None) is not None
+        if not has_moves:
+            return "checkmate" if chess.in_check() else "stalemate"
+        if chess.halfmove_clock >= 100:
+            return "draw"
+        return "ongoing"
+
+    def record(self, closed=False):
+        """
+        Persisted form of the session
+        :param closed: the game was closed by its client and cannot be resumed
+        """
+        return {"game": self.game_id, "fen": fen_.to_fen(self.chess), "moves": self.moves, "closed": closed}
+
+
+class SessionStore:
+    """
+    Append-only JSON lines file of session records, the last record of a game is its current state. Only the
+    offset of the last record of every game not closed is kept in memory, an evicted game is read back with
+    one seek.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.written = 0  # Number of written records
+        self.last_id = 0  # Highest game id in the file
+        self.offsets = {}  # Key = id of a game not closed, value = offset of its last record
+        try:
+            with open(path, "rb") as lines:
+                offset = 0
+                for line in lines:
+                    self._index(json.loads(line), offset)
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+
+    def _index(self, record, offset):
+        game_id = record["game"]
+        self.last_id = max(self.last_id, game_id)
+        if record.get("closed"):
+            self.offsets.pop(game_id, None)
+        else:
+            self.offsets[game_id] = offset
+
+    def write(self, records):
+        """Append a batch of records with a single write"""
+        if records:
+            lines = [(json.dumps(record) + "\n").encode() for record in records]
+            with open(self.path, "ab") as output:
+                offset = output.seek(0, os.SEEK_END)
+                output.write(b"".join(lines))
+            for record, line in zip(records, lines):
+                self._index(record, offset)
+                offset += len(line)
+            self.written += len(records)
+
+    def read(self, game_id):
+        """
+        :return: last record of a game, None if the game is unknown or closed
+        """
+        offset = self.offsets.get(game_id)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return json.loads(file.readline())
+
+
+class GameServer:
+    """
+    Registry of sessions answering the requests of any number of TCP connections
+    """
+
+    def __init__(self, store_path=None, idle_timeout=300.0, flush_interval=5.0, incremental=True):
+        """
+        :param store_path: JSON lines file where sessions are persisted, None to keep them only in memory
+        :param idle_timeout: seconds without requests before a session is persisted and evicted
+        :param flush_interval: seconds between two batch writes of the changed sessions
+        :param incremental: update the squares of Chess.move incrementally, see Chess
+        """
+        self.sessions = {}  # Key = game id
+        self.store = SessionStore(store_path) if store_path is not None else None
+        self.idle_timeout = idle_timeout
+        self.flush_interval = flush_interval
+        self.incremental = incremental
+        self.stats = Counter()  # Requests, moves, errors, created, evicted and restored sessions
+        self._ids = count(self.store.last_id + 1 if self.store is not None else 1)  # Unique across restarts
+        self._pending = []  # Records of evicted and closed sessions waiting for the next batch
+        self._writing = []  # Records of the batch being written
+        self._server = None
+        self._tasks = []
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """
+        Listen for connections and start the eviction and persistence tasks
+        :return: port number, useful with port 0
+        """
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self._tasks = [asyncio.ensure_future(self._evict_loop()), asyncio.ensure_future(self._flush_loop())]
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stop listening and persist all sessions"""
+        for task in self._tasks:
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for session in self.sessions.values():
+            session.dirty = True
+        await self.flush()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    response = self.dispatch(request)
+                except Exception as error:  # Whatever the request, answer it and keep the connection
+                    self.stats["errors"] += 1
+                    response = {"ok": False, "error": "{}: {}".format(type(error).__name__, error)}
+                if isinstance(request, dict) and "id" in request:  # Also on errors, for pipelining clients
+                    response["id"] = request["id"]
+                writer.write(json.dumps(response).encode() + b"\n")
+                if writer.transport.get_write_buffer_size() > 1 << 16:
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, request):
+        """
+        Answer one request
+        :param request: dictionary with the operation in "op"
+        :return: response dictionary
+        :raises ValueError: for invalid requests, e.g. an unknown game or an illegal move
+        """
+        self.stats["requests"] += 1
+        op = request.get("op")
+        if op == "stats":
+            return dict(self.stats, ok=True, sessions=len(self.sessions))
+        if op == "new":
+            fen = request.get("fen")
+            chess = fen_.from_fen(fen, incremental=self.incremental) if fen else \
+                Chess(setup="default", incremental=self.incremental)
+            game_id = next(self._ids)  # Taken once the FEN is valid
+            session = self.sessions[game_id] = Session(game_id, chess)
+            self.stats["created"] += 1
+            return self._state(session, request)
+
+        session = self.sessions.get(request.get("game")) or self._restore(request.get("game"))
+        if session is None:
+            raise ValueError("Unknown game {}".format(request.get("game")))
+        session.last_active = time.monotonic()
+        if op == "move":
+            self._move(session, request.get("move"))
+        elif op == "close":
+            del self.sessions[session.game_id]
+            self._pending.append(session.record(closed=True))
+            return {"ok": True, "game": session.game_id}
+        elif op != "state":
+            raise ValueError("Unknown operation {}".format(op))
+        return self._state(session, request)
+
+    def _restore(self, game_id):
+        """
+        Session of an evicted game from its last record, waiting to be written or in the store
+        :return: Session, None if the game is unknown or closed
+        """
+        record = next((record for record in reversed(self._pending + self._writing) if record["game"] == game_id),
+                      None)
+        if record is None and self.store is not None:
+            record = self.store.read(game_id)
+        if record is None or record["closed"]:
+            return None
+        session = self.sessions[game_id] = Session(game_id, fen_.from_fen(record["fen"], incremental=self.incremental))
+        session.moves = record["moves"]
+        session.dirty = False
+        self.stats["restored"] += 1
+        return session
+
+    def _move(self, session, text):
+        chess = session.chess
+        try:
+            move = Move.from_string(text)
+        except (AssertionError, TypeError):  # Not two squares in coordinate notation
+            move = None
+        # Chess.move reports invalid moves on standard output, they are rejected here first
+        if move is None or not chess.is_legal(move) or \
+                not chess.move(move.from_square, move.to_square, move.promotion):
+            raise ValueError("Illegal move {}".format(text))
+        session.moves.append(str(move))
+        session.dirty = True
+        self.stats["moves"] += 1
+
+    def _state(self, session, request):
+        chess = session.chess
+        moves = chess.generate_moves() if request.get("legal") else None  # Generated once for both fields
+        response = {"ok": True, "game": session.game_id, "fen": fen_.to_fen(chess), "status": session.status(moves)}
+        if moves is not None:
+            response["legal"] = [str(move) for move in moves]
+        return response
+
+    def evict(self, now=None):
+        """
+        Remove the sessions idle for longer than idle_timeout, they are persisted with the next batch
+        :return: number of evicted sessions
+        """
+        limit = (now if now is not None else time.monotonic()) - self.idle_timeout
+        idle = [session for session in self.sessions.values() if session.last_active < limit]
+        for session in idle:
+            del self.sessions[session.game_id]
+            self._pending.append(session.record())
+        self.stats["evicted"] += len(idle)
+        return len(idle)
+
+    async def flush(self):
+        """
+        Persist the changed and evicted sessions in one write, done by a thread not to block the requests
+        :return: number of written records
+        """
+        records, self._pending = self._pending, []
+        for session in self.sessions.values():
+            if session.dirty:
+                records.append(session.record())
+                session.dirty = False
+        if self.store is not None and records:
+            self._writing = records
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.store.write, records)
+            finally:
+                self._writing = []
+        return len(records)
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 60.0))
+            self.evict()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, **kwargs):
+    """
+    Run a GameServer until cancelled
+    :param kwargs: arguments of GameServer
+    """
+    server = GameServer(**kwargs)
+    port = await server.start(host, port)
+    print("Serving games on {}:{}".format(host, port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+async def _play(host, port, deadline, max_plies, rng, latencies, totals):
+    """Load generator client: play random games on one connection until the deadline"""
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def request(message):
+        start = time.perf_counter()
+        writer.write(json.dumps(message).encode() + b"\n")
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+        if not response["ok"]:
+            raise ValueError(response["error"])
+        return response
+
+    try:
+        while time.perf_counter() < deadline:
+            state = await request({"op": "new", "legal": True})
+            game_id = state["game"]
+            for _ in range(max_plies):
+                if state["status"] != "ongoing" or time.perf_counter() >= deadline:
+                    break
+                state = await request({"op": "move", "game": game_id, "move": rng.choice(state["legal"]),
+                                       "legal": True})
+                totals["moves"] += 1
+            await request({"op": "close", "game": game_id})
+            totals["games"] += 1
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    """:param values: sorted list"""
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+async def load(host="127.0.0.1", port=DEFAULT_PORT, clients=100, duration=10.0, max_plies=80, seed=None):
+    """
+    Play random games over many concurrent connections, each with one game at a time
+    :param clients: number of concurrent connections and games
+    :param duration: seconds of play
+    :param max_plies: plies after which a game is closed and a new one started
+    :return: dictionary with the numbers of moves, games and requests, moves per second and the 50th, 90th and
+             99th percentiles and maximum of the request latency in milliseconds
+    """
+    rng = random.Random(seed)
+    latencies, totals = [], Counter()
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[_play(host, port, deadline, max_plies, random.Random(rng.random()), latencies, totals)
+                           for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    report = {"clients": clients, "moves": totals["moves"], "games": totals["games"], "requests": len(latencies),
+              "moves_per_second": totals["moves"] / elapsed}
+    for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+        report[name + "_ms"] = percentile(latencies, fraction) * 1000
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many games over TCP, or generate load on a server")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server = commands.add_parser("serve", help="run the game server")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=DEFAULT_PORT)
+    server.add_argument("--store", default=None, help="JSON lines file where sessions are persisted")
+    server.add_argument("--idle", type=float, default=300.0, help="seconds before an idle session is evicted")
+    server.add_argument("--flush", type=float, default=5.0, help="seconds between two batch writes")
+    client = commands.add_parser("load", help="play random games against a server")
+    client.add_argument("--host", default="127.0.0.1")
+    client.add_argument("--port", type=int, default=DEFAULT_PORT)
+    client.add_argument("--clients", type=int, default=100, help="concurrent games")
+    client.add_argument("--duration", type=float, default=10.0, help="seconds of play")
+    client.add_argument("--plies", type=int, default=80, help="plies per game")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, store_path=args.store, idle_timeout=args.idle,
+                              flush_interval=args.flush))
+        except KeyboardInterrupt:
+            pass
+    else:
+        report = asyncio.run(load(args.host, args.port, args.clients, args.duration, args.plies))
+        print("Clients: {clients}, games: {games}, moves: {moves}, {moves_per_second:.0f} moves/s".format(**report))
+        print("Latency: p50 {p50_ms:.1f} ms, p90 {p90_ms:.1f} ms, p99 {p99_ms:.1f} ms, max {max_ms:.1f} ms"
+              .format(**report))
+
+
+if __name__ == "__main__":
+    main()
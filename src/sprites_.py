@@ -1,5 +1,8 @@
 from src import *
 
+import pygame
+
+
 def chess_to_screen( x, y, square_size=SQUARE_SIZE):
     """Conversion of chess coordinates to screen coordinates"""
     board_size = 8 * square_size
@@ -14,6 +17,59 @@ def screen_to_chess(xs, ys, square_size=SQUARE_SIZE):
     y = round((-ys + SCREEN_HEIGHT / 2 + board_size / 2 - square_size / 2) / square_size)
     return x, y
 
+# Decoded piece surfaces shared by all sprites, key = (piece name with color, square size)
+_surface_cache = {}
+
+ATLAS_COLUMNS = "QKRNBP"  # Order of the pieces in each row of ATLAS_FILE
+ATLAS_ROWS = "bw"
+ATLAS_PIECE_SIZE = 60
+
+
+def _prepare_surface(surf, square_size):
+    """Scale a piece image to the square size and convert it to the display pixel format for fast blits"""
+    if square_size != SQUARE_SIZE:
+        width, height = surf.get_size()
+        scale = square_size / SQUARE_SIZE
+        surf = pygame.transform.smoothscale(surf, (round(width * scale), round(height * scale)))
+    if pygame.display.get_surface() is not None:  # Conversion needs a display mode
+        surf = surf.convert_alpha()
+    surf.set_colorkey((255, 255, 255), pygame.RLEACCEL)
+    return surf
+
+
+def load_piece_surface(name, square_size=SQUARE_SIZE):
+    """
+    Surface of a piece image, decoded from disk only the first time
+    :param name: piece name with color, e.g. "Nw"
+    :param square_size: size of the board squares the image is drawn on
+    :return: pygame Surface shared by all sprites, not to be modified
+    """
+    key = (name, square_size)
+    if key not in _surface_cache:
+        surf = pygame.image.load(os.path.join(ASSETS_FOLDER, name + ".png"))
+        _surface_cache[key] = _prepare_surface(surf, square_size)
+    return _surface_cache[key]
+
+
+def load_atlas(square_size=SQUARE_SIZE):
+    """
+    Fill the surface cache with all pieces sliced from the atlas image, decoded in a single load
+    :param square_size: size of the board squares the images are drawn on
+    :return: None
+    """
+    atlas = pygame.image.load(ATLAS_FILE)
+    for row, color in enumerate(ATLAS_ROWS):
+        for column, name in enumerate(ATLAS_COLUMNS):
+            rect = (column * ATLAS_PIECE_SIZE, row * ATLAS_PIECE_SIZE, ATLAS_PIECE_SIZE, ATLAS_PIECE_SIZE)
+            surf = atlas.subsurface(rect).copy()
+            _surface_cache[(name + color, square_size)] = _prepare_surface(surf, square_size)
+
+
+def clear_surface_cache():
+    """Drop all cached surfaces, e.g. after changing the display mode"""
+    _surface_cache.clear()
+
+
 class BoardSprite(pygame.sprite.Sprite):
     """
     Class to handle the board an all background objects in the game
@@ -22,6 +78,8 @@ class BoardSprite(pygame.sprite.Sprite):
     def __init__(self):
         super(BoardSprite, self).__init__()
         self.surf = pygame.image.load(BOARD_FILE)
+        if pygame.display.get_surface() is not None:
+            self.surf = self.surf.convert()
         self.rect = self.surf.get_rect(center=(SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2))
 
 
@@ -32,8 +90,7 @@ class PieceSprite(pygame.sprite.Sprite):
 
     def __init__(self, x=None, y=None, name=None):
         super(PieceSprite, self).__init__()
-        self.surf = pygame.image.load(os.path.join(ASSETS_FOLDER, name + ".png"))
-        self.surf.set_colorkey((255, 255, 255), pygame.RLEACCEL)
+        self.surf = load_piece_surface(name)
 
         self.x, self.y = x, y
         self.rect = []
@@ -3,54 +3,88 @@ from src import *
 
 class Square:
     """
-    Simple class to store the position of a piece with chess notation
+    Simple class to store the position of a piece with chess notation.
+    Squares are flyweights: there are exactly 64 instances, and Square("e4"), Square((4, 3)),
+    Square.from_name("e4") and Square.from_xy(4, 3) all return the same object.
     """
+    __slots__ = ("x", "y", "index", "file", "rank", "name")
 
-    def __init__(self, data):
-        self.x, self.y = None, None
-        self.file, self.rank = None, None
+    _instances = []  # Canonical squares, position = index
+    _by_name = {}
 
+    def __new__(cls, data):
         if isinstance(data, str):
-            data = data.lower()
-            assert len(data) == 2, "Input string must be length 2"
-
-            self.x = ord(data[0]) - ord('a')
-            self.y = ord(data[1]) - ord('1')
-
-            self.file = data[0]
-            self.rank = data[1]
-
+            return cls.from_name(data)
         elif isinstance(data, tuple):
-            self.x = data[0]
-            self.y = data[1]
-
-            self.file = chr(97 + self.x)
-            self.rank = chr(49 + self.y)
-
+            return cls.from_xy(*data)
         else:
             raise ValueError("Wrong initialization of square, provide a tuple or a string")
 
-        assert -1 < self.x < 8, 'Coordinate value is not within the range [0,7]'
-        assert -1 < self.y < 8, 'Coordinate value is not within the range [0,7]'
+    @classmethod
+    def from_xy(cls, x, y, validate=True):
+        """
+        Canonical square with coordinates (x,y)
+        :param validate: check the range of the coordinates, skip it for values known to be valid
+        :return: Square
+        """
+        if validate:
+            assert -1 < x < 8, 'Coordinate value is not within the range [0,7]'
+            assert -1 < y < 8, 'Coordinate value is not within the range [0,7]'
+        return cls._instances[y * 8 + x]
+
+    @classmethod
+    def from_name(cls, name, validate=True):
+        """
+        Canonical square from chess notation, e.g. "e4"
+        :param validate: check the notation, skip it for names known to be valid lowercase squares
+        :return: Square
+        """
+        if validate:
+            name = name.lower()
+            assert len(name) == 2, "Input string must be length 2"
+            assert name in cls._by_name, 'Coordinate value is not within the range [0,7]'
+        return cls._by_name[name]
+
+    @classmethod
+    def from_index(cls, index):
+        """Canonical square from its index 8 * y + x in [0,63], without validation"""
+        return cls._instances[index]
+
+    @classmethod
+    def _create(cls, index):
+        self = object.__new__(cls)
+        self.x, self.y = index % 8, index // 8
+        self.index = index
+        self.file = chr(97 + self.x)
+        self.rank = chr(49 + self.y)
+        self.name = self.file + self.rank
+        return self
 
     def __str__(self):
-        return self.file + self.rank
+        return self.name
 
     def __repr__(self):
-        return "".join([self.file, self.rank])
+        return self.name
 
     def __eq__(self, other):
-        return (self.x == other.x) and (self.y == other.y)
+        return isinstance(other, Square) and self.index == other.index
 
     def __hash__(self):
-        return hash(repr(self))
+        return self.index
 
     def __lt__(self, other):
         return self.x < other.x and self.y < other.y
 
+    def __reduce__(self):
+        return Square.from_index, (self.index,)  # Unpickle to the canonical instance
+
     def values(self):
         return self.x, self.y
 
+
+Square._instances.extend(Square._create(index) for index in range(64))
+Square._by_name.update((square.name, square) for square in Square._instances)
+
 # class Square(namedtuple("BaseSquare", "x y")):
 #     """
 #     Position of a piece with coordinates (x,y) in the range [0,7]
@@ -0,0 +1,451 @@
+from src import *
+from src.optional_ import np, require_numpy
+
+import argparse
+import mmap
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Endgame tablebases without pawns, e.g. KQK, KRK or KNNK: the result and distance to mate of every position
+# of a piece set, solved by retrograde analysis. The white king is moved by one of the 8 symmetries of the
+# board into the triangle a1-d1-d4, so a table of n pieces has 2 * 10 * 64 ** (n - 1) positions with the
+# perfect index ((side to move * 10 + white king) * 64 + square of the second piece) * 64 + ...
+#
+# Files hold a 16-byte header (MAGIC and the piece set) and one byte per position: 0 for a draw, 255 for
+# illegal positions and 1 + distance to mate in plies otherwise, odd distances are wins for the side to move.
+# Pieces of a set follow the order K, QRBN for white, then K, QRBN for black, e.g. "KQKR".
+
+WIN, DRAW, LOSS = 1, 0, -1
+MAGIC = b"PYTB"
+HEADER_SIZE = 16
+EXTENSION = ".tb"
+
+_INVALID = 255
+_MATE = 1000  # Working values: _MATE - plies for wins, plies - _MATE for losses and 0 for draws
+_NONE = -32768  # No move
+_ORDER = "KQRBN"
+
+
+def _transforms():
+    """The 8 symmetries of the board as permutations of the square indices"""
+    transforms = []
+    for flip_x in (False, True):
+        for flip_y in (False, True):
+            for swap in (False, True):
+                permutation = []
+                for index in range(64):
+                    x, y = index % 8, index // 8
+                    x, y = (7 - x if flip_x else x), (7 - y if flip_y else y)
+                    if swap:
+                        x, y = y, x
+                    permutation.append(y * 8 + x)
+                transforms.append(permutation)
+    return transforms
+
+
+TRANSFORMS = _transforms()
+TRIANGLE = [y * 8 + x for x in range(4) for y in range(x + 1)]  # Squares of the white king in a table
+_TRIANGLE_INDEX = [TRIANGLE.index(index) if index in TRIANGLE else -1 for index in range(64)]
+# Key = square of the white king, value = index of the symmetry that moves it into the triangle
+_CANONICAL = [next(i for i, t in enumerate(TRANSFORMS) if t[index] in TRIANGLE) for index in range(64)]
+
+
+def _reach_mask(name, index):
+    """Squares reached by a piece on an empty board"""
+    if name == "K":
+        return tables_.KING_MASKS[index]
+    if name == "N":
+        return tables_.KNIGHT_MASKS[index]
+    directions = {"R": tables_.ROOK_DIRECTIONS, "B": tables_.BISHOP_DIRECTIONS,
+                  "Q": tables_.ROOK_DIRECTIONS + tables_.BISHOP_DIRECTIONS}[name]
+    mask = 0
+    for direction in directions:
+        mask |= tables_.RAY_MASKS[direction][index]
+    return mask
+
+
+_REACH = {name: [list(bitboard_.iter_bits(_reach_mask(name, index))) for index in range(64)] for name in _ORDER}
+
+
+def normalize(pieces):
+    """
+    Canonical name of a piece set
+    :param pieces: string as "KQK", "KNNK" or "KRKQ", white pieces before the second king
+    :return: string with the pieces of each color in the order K, QRBN
+    :raises ValueError: for sets with pawns or without two kings
+    """
+    pieces = pieces.upper()
+    if pieces.count("K") != 2 or not pieces.startswith("K") or set(pieces) - set(_ORDER):
+        raise ValueError("Piece set must be two kings and pieces QRBN, e.g. KQK: {}".format(pieces))
+    second = pieces.index("K", 1)
+    white, black = sorted(pieces[1:second], key=_ORDER.index), sorted(pieces[second + 1:], key=_ORDER.index)
+    return "K" + "".join(white) + "K" + "".join(black)
+
+
+def _codes(pieces):
+    """Piece codes of a normalized piece set, in the order of the set"""
+    second = pieces.index("K", 1)
+    return [bitboard_.piece_code(name, i < second) for i, name in enumerate(pieces)]
+
+
+def _shape(pieces):
+    return (2, len(TRIANGLE)) + (64,) * (len(pieces) - 1)
+
+
+def _decode(data):
+    """Working values and legal flags of the bytes of a table file"""
+    data = data.astype(np.int16)
+    plies = data - 1
+    values = np.where(plies % 2 == 1, _MATE - plies, plies - _MATE)
+    values[(data == 0) | (data == _INVALID)] = 0
+    return values.astype(np.int16), data != _INVALID
+
+
+def _encode(values, valid):
+    plies = np.where(values > 0, _MATE - values, values + _MATE)
+    data = np.where(values == 0, 0, plies + 1)
+    data[~valid] = _INVALID
+    return data.astype(np.uint8)
+
+
+def _child_values(values):
+    """Value for the player moving into positions with these values, one ply further from mate"""
+    return np.where(values > 0, 1 - values, np.where(values < 0, -values - 1, 0)).astype(np.int16)
+
+
+class _Geometry:
+    """Legal positions and checks of a piece set, computed once per process with array operations"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.codes = _codes(pieces)
+        self.shape = _shape(pieces)
+        n = len(self.codes)
+        between = np.array(tables_.BETWEEN, dtype=np.uint64)
+        reach = {name: np.zeros((64, 64), dtype=bool) for name in _ORDER}
+        for name in _ORDER:
+            for index in range(64):
+                reach[name][index, _REACH[name][index]] = True
+
+        # Square of each piece broadcast along its own axis, the white king takes the triangle squares
+        squares = [np.array(TRIANGLE).reshape((-1,) + (1,) * (n - 1))]
+        for p in range(1, n):
+            squares.append(np.arange(64).reshape((1,) * p + (64,) + (1,) * (n - 1 - p)))
+
+        distinct = np.ones(self.shape[1:], dtype=bool)
+        for p in range(n):
+            for q in range(p + 1, n):
+                distinct &= squares[p] != squares[q]
+        kings = [p for p, code in enumerate(self.codes) if code % bitboard_.BLACK_OFFSET == 5]
+        distinct &= ~reach["K"][squares[kings[0]], squares[kings[1]]]
+
+        attacked = []  # By color of the attacked king, white first
+        for king in kings:
+            is_white = self.codes[king] < bitboard_.BLACK_OFFSET
+            check = np.zeros(self.shape[1:], dtype=bool)
+            for q, code in enumerate(self.codes):
+                if (code < bitboard_.BLACK_OFFSET) == is_white or q in kings:
+                    continue
+                hits = reach[bitboard_.code_name(code)[0]][squares[q], squares[king]]
+                path = between[squares[q], squares[king]]
+                for r in range(n):
+                    if r != q and r != king:
+                        hits = hits & ((path >> squares[r].astype(np.uint64)) & np.uint64(1) == 0)
+                check |= hits
+            attacked.append(check)
+
+        # Side to move 0 is white: the side that just moved cannot be in check
+        self.valid = np.stack([distinct & ~attacked[1], distinct & ~attacked[0]])
+        self.in_check = np.stack([attacked[0], attacked[1]]) & self.valid
+
+
+_geometries = {}
+
+
+def _geometry(pieces):
+    if pieces not in _geometries:
+        _geometries[pieces] = _Geometry(pieces)
+    return _geometries[pieces]
+
+
+def _free_mask(source, targets, n, axis, other):
+    """
+    Moves from source to each target are not blocked by the piece on the axis other: it is neither on the
+    target nor between. The mask has the targets along axis and the squares of the other piece along other.
+    """
+    squares = np.arange(64)
+    path = np.array([tables_.BETWEEN[source][t] for t in targets], dtype=np.uint64)
+    free = ((path[:, None] >> squares[None, :].astype(np.uint64)) & np.uint64(1) == 0) & \
+        (squares[None, :] != np.array(targets)[:, None])
+    shape = [1] * n
+    shape[axis], shape[other] = len(targets), 64
+    return (free if axis < other else free.T).reshape(shape)
+
+
+def _targets(name, source, king_square):
+    """Targets of a piece that are not the square of the white king nor behind it"""
+    return [t for t in _REACH[name][source]
+            if t != king_square and not tables_.BETWEEN[source][t] >> king_square & 1]
+
+
+def _solve_chunk(pieces, values_path, directory, stm, w, captures):
+    """
+    Worker task: best move value of every position of a piece set with a given side to move and white king
+    :param values_path: .npy file with the working values of the whole table, not used for captures
+    :param captures: only look at captures, whose values come from the finished smaller tables
+    :return: tuple (stm, w, best child value or _NONE without moves, True where there is a move)
+    """
+    geometry = _geometry(pieces)
+    codes = geometry.codes
+    n = len(codes) - 1  # Axes of a chunk, one per piece other than the white king
+    king_square = TRIANGLE[w]
+    mover_is_white = stm == 0
+    best = np.full((64,) * n, _NONE, dtype=np.int16)
+    has_move = np.zeros((64,) * n, dtype=bool)
+
+    def update(region, child, mask):
+        best[region] = np.maximum(best[region], np.where(mask, child, _NONE))
+        has_move[region] |= mask
+
+    if not captures:
+        table = np.load(values_path, mmap_mode="r")
+        values, valid = table[1 - stm, w], geometry.valid[1 - stm, w]
+        for axis in range(n):
+            code = codes[axis + 1]
+            if (code < bitboard_.BLACK_OFFSET) != mover_is_white:
+                continue
+            name = bitboard_.code_name(code)[0]
+            for source in range(64):
+                targets = _targets(name, source, king_square)
+                if not targets:
+                    continue
+                mask = np.take(valid, targets, axis=axis)
+                for other in range(n):
+                    if other != axis:
+                        mask = mask & _free_mask(source, targets, n, axis, other)
+                child = np.where(mask, _child_values(np.take(values, targets, axis=axis)), _NONE)
+                region = (slice(None),) * axis + (source,)
+                update(region, child.max(axis=axis), mask.any(axis=axis))
+
+        if mover_is_white:  # The white king can leave the triangle, the position is then moved back into it
+            squares = np.arange(64)
+            for target in _REACH["K"][king_square]:
+                transform = TRANSFORMS[_CANONICAL[target]]
+                permutation = np.ix_(*[np.array(transform)] * n)
+                w2 = _TRIANGLE_INDEX[transform[target]]
+                mask = geometry.valid[1, w2][permutation]
+                for other in range(n):
+                    mask = mask & (squares != target).reshape((1,) * other + (64,) + (1,) * (n - 1 - other))
+                update((), _child_values(np.asarray(table[1, w2])[permutation]), mask)
+        return stm, w, best, has_move
+
+    for victim in range(1, len(codes)):
+        code = codes[victim]
+        if (code < bitboard_.BLACK_OFFSET) == mover_is_white or code % bitboard_.BLACK_OFFSET == 5:
+            continue
+        smaller = pieces[:victim] + pieces[victim + 1:]
+        sub_values, sub_valid = _load_values(directory, smaller)
+        v = victim - 1  # Chunk axis of the captured piece
+
+        for axis in range(n):
+            code = codes[axis + 1]
+            if (code < bitboard_.BLACK_OFFSET) != mover_is_white:
+                continue
+            name = bitboard_.code_name(code)[0]
+            sub_axis = axis if axis < v else axis - 1  # Axis of the moving piece once the victim is removed
+            for source in range(64):
+                for target in _targets(name, source, king_square):
+                    mask = np.take(sub_valid[1 - stm, w], target, axis=sub_axis)
+                    child = _child_values(np.take(sub_values[1 - stm, w], target, axis=sub_axis))
+                    remaining = [other for other in range(n) if other != axis and other != v]
+                    for i in range(len(remaining)):
+                        mask = mask & _blocker_mask(source, target, len(remaining), i)
+                    region = tuple(source if i == axis else target if i == v else slice(None) for i in range(n))
+                    update(region, child, mask)
+
+        if mover_is_white:
+            for target in _REACH["K"][king_square]:
+                transform = TRANSFORMS[_CANONICAL[target]]
+                permutation = np.ix_(*[np.array(transform)] * (n - 1))
+                w2 = _TRIANGLE_INDEX[transform[target]]
+                region = tuple(target if i == v else slice(None) for i in range(n))
+                update(region, _child_values(sub_values[1, w2][permutation]), sub_valid[1, w2][permutation])
+    return stm, w, best, has_move
+
+
+def _blocker_mask(source, target, n, axis):
+    """True where the piece on an axis of n is not between source and target"""
+    path = tables_.BETWEEN[source][target]
+    free = np.array([not path >> index & 1 for index in range(64)])
+    return free.reshape((1,) * axis + (64,) + (1,) * (n - 1 - axis))
+
+
+def table_path(directory, pieces):
+    return os.path.join(directory, normalize(pieces) + EXTENSION)
+
+
+def _load_values(directory, pieces):
+    with open(table_path(directory, pieces), "rb") as file:
+        file.seek(HEADER_SIZE)
+        data = np.frombuffer(file.read(), dtype=np.uint8).reshape(_shape(pieces))
+    return _decode(data)
+
+
+def generate(pieces, directory, workers=None, verbose=False):
+    """
+    Solve a piece set by retrograde analysis and write its table, first generating the missing tables of
+    the piece sets reached by captures. Every iteration finds the positions one ply further from mate, the
+    chunks of positions of each side to move and white king square are solved in parallel, reading the values
+    of the previous iteration from a shared memory-mapped file.
+    :param pieces: piece set as "KQK"
+    :param directory: folder of the table files
+    :param workers: number of processes, os.cpu_count() by default
+    :return: path of the table file
+    """
+    require_numpy("generating tablebases")
+    pieces = normalize(pieces)
+    os.makedirs(directory, exist_ok=True)
+    codes = _codes(pieces)
+    for victim in range(1, len(codes)):
+        if codes[victim] % bitboard_.BLACK_OFFSET != 5:
+            smaller = pieces[:victim] + pieces[victim + 1:]
+            if not os.path.exists(table_path(directory, smaller)):
+                generate(smaller, directory, workers, verbose)
+
+    geometry = _geometry(pieces)
+    chunks = [(stm, w) for stm in range(2) for w in range(len(TRIANGLE))]
+    with tempfile.TemporaryDirectory() as work, ProcessPoolExecutor(workers or os.cpu_count()) as executor:
+        values_path = os.path.join(work, "values.npy")
+        values = np.lib.format.open_memmap(values_path, mode="w+", dtype=np.int16, shape=geometry.shape)
+        values[...] = 0
+        values.flush()
+
+        def solve(captures):
+            best = np.empty(geometry.shape, dtype=np.int16)
+            has_move = np.empty(geometry.shape, dtype=bool)
+            futures = [executor.submit(_solve_chunk, pieces, values_path, directory, stm, w, captures)
+                       for stm, w in chunks]
+            for future in futures:
+                stm, w, chunk_best, chunk_has_move = future.result()
+                best[stm, w], has_move[stm, w] = chunk_best, chunk_has_move
+            return best, has_move
+
+        capture_best, capture_has_move = solve(True)  # Smaller tables are final, captures are solved once
+        no_move = np.where(geometry.in_check, -_MATE, 0).astype(np.int16)
+        iteration = 0
+        while True:
+            best, has_move = solve(False)
+            best = np.maximum(best, capture_best)
+            new_values = np.where(has_move | capture_has_move, best, no_move)
+            new_values[~geometry.valid] = 0
+            iteration += 1
+            if verbose:
+                print("{} iteration {}: {} decided positions".format(pieces, iteration, np.count_nonzero(new_values)))
+            if np.array_equal(new_values, values):
+                break
+            values[...] = new_values
+            values.flush()
+
+        data = _encode(np.asarray(values), geometry.valid)
+        del values
+
+    path = table_path(directory, pieces)
+    with open(path, "wb") as output:
+        output.write(MAGIC + pieces.encode().ljust(HEADER_SIZE - len(MAGIC), b" "))
+        output.write(data.tobytes())
+    return path
+
+
+def _material(chess, is_white):
+    offset = 0 if is_white else bitboard_.BLACK_OFFSET
+    return "K" + "".join(name * bitboard_.popcount(chess.bitboards[offset + bitboard_.PIECE_NAMES.index(name)])
+                         for name in _ORDER[1:])
+
+
+class Tablebases:
+    """
+    Probe the table files of a folder, each one mapped in memory when first needed
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: folder with files written by generate
+        """
+        self.directory = directory
+        self.available = {name[:-len(EXTENSION)] for name in os.listdir(directory) if name.endswith(EXTENSION)}
+        self.max_pieces = max((len(pieces) for pieces in self.available), default=0)
+        self._maps = {}
+
+    def close(self):
+        for file, data in self._maps.values():
+            data.close()
+            file.close()
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _map(self, pieces):
+        if pieces not in self._maps:
+            file = open(table_path(self.directory, pieces), "rb")
+            self._maps[pieces] = file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[pieces][1]
+
+    def probe(self, chess):
+        """
+        Exact result of a position
+        :param chess: Chess object
+        :return: tuple (WIN, DRAW or LOSS for the current player, distance to mate in plies), None if the
+                 position is not covered by the tables
+        """
+        bb = chess.bitboards
+        if bb[0] or bb[bitboard_.BLACK_OFFSET] or chess.castling_rights or \
+                bitboard_.popcount(chess.occupied) > self.max_pieces:
+            return None
+
+        white, black = _material(chess, True), _material(chess, False)
+        stm, flip = (0 if chess.is_current_white else 1), 0
+        pieces = white + black
+        if pieces not in self.available:  # Same table with the colors swapped and the board mirrored
+            pieces, stm, flip = black + white, 1 - stm, 56
+            if pieces not in self.available:
+                return None
+
+        indices, used = [], Counter()
+        for code in _codes(pieces):
+            if flip:
+                code = (code + bitboard_.BLACK_OFFSET) % 12
+            indices.append(list(bitboard_.iter_bits(bb[code]))[used[code]] ^ flip)  # Same pieces in bit order
+            used[code] += 1
+
+        transform = TRANSFORMS[_CANONICAL[indices[0]]]
+        position = stm * len(TRIANGLE) + _TRIANGLE_INDEX[transform[indices[0]]]
+        for index in indices[1:]:
+            position = position * 64 + transform[index]
+
+        data = self._map(pieces)[HEADER_SIZE + position]
+        if data == _INVALID:
+            return None
+        if data == 0:
+            return DRAW, 0
+        plies = data - 1
+        return (WIN if plies % 2 else LOSS), plies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases")
+    parser.add_argument("pieces", nargs="+", help="piece sets, e.g. KQK KRK KNNK")
+    parser.add_argument("--directory", default="tablebases", help="folder of the table files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    args = parser.parse_args()
+
+    for pieces in args.pieces:
+        print(generate(pieces, args.directory, workers=args.workers, verbose=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+from src import *
+
+# Lookup tables for the moves of every piece type on each of the 64 squares, square index = 8 * y + x.
+# They are computed once at import and shared, so none of the lists or dictionaries must be modified.
+
+ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (-1, 1), (-1, -1), (1, -1))
+KNIGHT_OFFSETS = tuple(zip([2, 2, -2, -2, 1, 1, -1, -1], [1, -1, 1, -1, 2, -2, 2, -2]))
+KING_OFFSETS = tuple(zip([-1, -1, -1, 0, 0, 1, 1, 1], [1, 0, -1, 1, -1, 1, 0, -1]))
+PAWN_START_RANK = {True: 1, False: 6}
+
+
+def _on_board(x, y):
+    return (-1 < x < 8) and (-1 < y < 8)
+
+
+def _mask(squares):
+    bb = 0
+    for s in squares:
+        bb |= 1 << s.index
+    return bb
+
+
+def _ray(x1, y1, dx, dy):
+    """Squares from (x1, y1) in the direction (dx, dy), sorted by distance"""
+    squares = []
+    x, y = x1 + dx, y1 + dy
+    while _on_board(x, y):
+        squares.append(Square.from_xy(x, y, validate=False))
+        x, y = x + dx, y + dy
+    return squares
+
+
+def _targets(x1, y1, offsets):
+    return [Square.from_xy(x1 + x, y1 + y, validate=False) for x, y in offsets if _on_board(x1 + x, y1 + y)]
+
+
+def _pawn_pushes(x1, y1, is_white):
+    direction = +1 if is_white else -1  # Black pawns move downwards, white pawns move upwards
+    steps = 2 if y1 == PAWN_START_RANK[is_white] else 1  # Starting pawns can jump 1 or 2 squares
+    return [Square.from_xy(x1, y1 + direction * step, validate=False) for step in range(1, steps + 1)
+            if _on_board(x1, y1 + direction * step)]
+
+
+def _pawn_captures(x1, y1, is_white):
+    direction = +1 if is_white else -1
+    return {(dx, direction): _targets(x1, y1, [(dx, direction)]) for dx in (1, -1)}
+
+
+_SQUARES = [(index % 8, index // 8) for index in range(64)]
+
+# Ordered sliding rays, key = direction
+RAYS = {d: [_ray(x, y, *d) for x, y in _SQUARES] for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+RAY_MASKS = {d: [_mask(ray) for ray in rays] for d, rays in RAYS.items()}
+
+# Rays grow with the square index in these directions, so the closest blocker is the lowest set bit
+POSITIVE_DIRECTIONS = frozenset(d for d in RAYS if d[1] * 8 + d[0] > 0)
+
+
+def _between():
+    between = [[0] * 64 for _ in range(64)]
+    for rays in RAYS.values():
+        for index, ray in enumerate(rays):
+            mask = 0
+            for square in ray:
+                between[index][square.index] = mask
+                mask |= 1 << square.index
+    return between
+
+
+# Squares strictly between two squares on the same rank, file or diagonal, 0 for other pairs, key = both indices
+BETWEEN = _between()
+
+KNIGHT_TARGETS = [_targets(x, y, KNIGHT_OFFSETS) for x, y in _SQUARES]
+KNIGHT_MASKS = [_mask(targets) for targets in KNIGHT_TARGETS]
+
+KING_TARGETS = [_targets(x, y, KING_OFFSETS) for x, y in _SQUARES]
+KING_MASKS = [_mask(targets) for targets in KING_TARGETS]
+
+# Pawn tables, key = is_white
+PAWN_PUSHES = {c: [_pawn_pushes(x, y, c) for x, y in _SQUARES] for c in (True, False)}
+PAWN_CAPTURES = {c: [_pawn_captures(x, y, c) for x, y in _SQUARES] for c in (True, False)}
+PAWN_ATTACK_MASKS = {c: [_mask(chain(*captures.values())) for captures in PAWN_CAPTURES[c]] for c in (True, False)}
+
+
+def _direction_squares(index, directions):
+    return {d: RAYS[d][index] for d in directions}
+
+
+def _king_squares(index):
+    x1, y1 = _SQUARES[index]
+    return {d: _targets(x1, y1, [d]) for d in BISHOP_DIRECTIONS + ROOK_DIRECTIONS}
+
+
+# Piece.valid_squares dictionaries of a piece alone in the board, key = piece name, then is_white for pawns
+VALID_SQUARES = {
+    'R': [_direction_squares(i, ROOK_DIRECTIONS) for i in range(64)],
+    'B': [_direction_squares(i, BISHOP_DIRECTIONS) for i in range(64)],
+    'Q': [_direction_squares(i, ROOK_DIRECTIONS + BISHOP_DIRECTIONS) for i in range(64)],
+    'N': [{(0, 0): KNIGHT_TARGETS[i]} for i in range(64)],  # No directional information, Knights jump over pieces
+    'K': [_king_squares(i) for i in range(64)],
+    'P': {c: [{(0, +1 if c else -1): PAWN_PUSHES[c][i]} for i in range(64)] for c in (True, False)},
+}
@@ -0,0 +1,323 @@
+from src import *
+from src import book_
+from src import tablebase_
+
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Universal Chess Interface front-end: python -m src.uci_ speaks UCI on stdin / stdout. Commands are read by
+# an asyncio loop while the search runs in a worker thread, so isready, stop or position are answered at once
+# during a search. All output is written by the loop thread; the search thread hands its lines over with
+# call_soon_threadsafe.
+
+NAME = "pychess"
+AUTHOR = "pychess authors"
+INFO_INTERVAL = 1.0  # Seconds between the info lines with the node count during a search
+MOVE_OVERHEAD = 0.05  # Seconds kept back from every move for the communication with the GUI
+DEFAULT_HASH = 16  # Megabytes of the transposition table
+
+_GO_PARAMETERS = ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes", "mate")
+
+
+def parse_go(tokens):
+    """
+    :param tokens: arguments of the go command, e.g. ["wtime", "60000", "btime", "60000", "ponder"]
+    :return: dictionary with the integer parameters and the flags "infinite" and "ponder"
+    """
+    parameters = {"infinite": False, "ponder": False}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ("infinite", "ponder"):
+            parameters[token] = True
+        elif token in _GO_PARAMETERS and i + 1 < len(tokens):
+            parameters[token] = int(tokens[i + 1])
+            i += 1
+        i += 1
+    return parameters
+
+
+def allocate_time(parameters, is_white):
+    """
+    Time to spend on a move
+    :param parameters: dictionary of parse_go
+    :param is_white: color of the engine
+    :return: seconds, None to search until the depth limit or the stop command
+    """
+    if "movetime" in parameters:
+        return max(0.0, parameters["movetime"] / 1000 - MOVE_OVERHEAD)
+    remaining = parameters.get("wtime" if is_white else "btime")
+    if remaining is None:
+        return None
+    increment = parameters.get("winc" if is_white else "binc", 0)
+    moves = parameters.get("movestogo", 30)
+    budget = remaining / max(moves, 1) + increment * 3 / 4
+    return max(0.0, min(budget, remaining / 2) / 1000 - MOVE_OVERHEAD)
+
+
+def table_bits(megabytes):
+    """
+    :param megabytes: value of the Hash option
+    :return: size_bits of the largest TranspositionTable that fits in the given memory, at least 1 entry
+    """
+    entries = max(1, megabytes * (1 << 20) // search_.ENTRY_BYTES)
+    return entries.bit_length() - 1
+
+
+def format_score(score):
+    """UCI score of a search score: "cp 35", or "mate 3" / "mate -2" in moves"""
+    if abs(score) > search_.MATE_BOUND:
+        plies = search_.MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return "mate {}".format(moves if score > 0 else -moves)
+    return "cp {}".format(score)
+
+
+class UciEngine:
+    """
+    State of the engine between commands: the position, the options and the search running in the background
+    """
+
+    def __init__(self, output=None, hash_size=DEFAULT_HASH):
+        """
+        :param output: text file of the responses, sys.stdout by default
+        :param hash_size: megabytes of the transposition table, as the Hash option
+        """
+        self.output = output if output is not None else sys.stdout
+        self.searcher = search_.Searcher(search_.TranspositionTable(table_bits(hash_size)))
+        self.position = Chess(setup="default")
+        self.book = None
+        self.tablebases = None
+        self.loop = None
+        self._executor = ThreadPoolExecutor(1)  # Only one search at a time
+        self._search = None  # asyncio Future of the running search
+        self._stop = threading.Event()
+        self._release = threading.Event()  # An infinite or ponder search waits for it before its best move
+        self._time_limit = None  # Time allocated to the move being pondered, used on ponderhit
+        self._start = 0.0
+
+    def send(self, line):
+        self.output.write(line + "\n")
+        self.output.flush()
+
+    def _send_threadsafe(self, line):
+        self.loop.call_soon_threadsafe(self.send, line)
+
+    async def run(self, lines=None):
+        """
+        Answer commands until quit or the end of the input
+        :param lines: async iterable of command lines, standard input by default
+        """
+        self.loop = asyncio.get_running_loop()
+        lines = lines if lines is not None else self._stdin_lines()
+        async for line in lines:
+            if not await self.handle(line):
+                break
+        await self.stop()
+        self._executor.shutdown()
+
+    async def _stdin_lines(self):
+        """Lines of standard input, each read by a thread of the default executor not to block the loop"""
+        while True:
+            line = await self.loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                return
+            yield line
+
+    async def handle(self, line):
+        """
+        Execute one command
+        :param line: command line, e.g. "position startpos moves e2e4"
+        :return: False on quit
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        try:
+            return await self._execute(command, arguments)
+        except (ValueError, AssertionError, KeyError, IndexError, OSError) as error:
+            # Invalid arguments, e.g. a malformed move or FEN, or a missing book file: the engine keeps running
+            self.send("info string invalid command {}: {}".format(line.strip(), error))
+            return True
+
+    async def _execute(self, command, arguments):
+        if command == "uci":
+            self.send("id name " + NAME)
+            self.send("id author " + AUTHOR)
+            self.send("option name Hash type spin default {} min 1 max 1024".format(DEFAULT_HASH))
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            await self.stop()
+            self.set_option(arguments)
+        elif command == "ucinewgame":
+            await self.stop()
+            self.searcher.table.clear()
+        elif command == "position":
+            self.set_position(arguments)
+        elif command == "go":
+            await self.stop()
+            self.go(parse_go(arguments))
+        elif command == "stop":
+            await self.stop()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            return False
+        else:
+            self.send("info string unknown command " + command)
+        return True
+
+    def set_option(self, arguments):
+        """
+        :param arguments: tokens of "name <name> value <value>"
+        """
+        if "name" not in arguments:
+            return
+        value_at = arguments.index("value") if "value" in arguments else len(arguments)
+        name = " ".join(arguments[arguments.index("name") + 1:value_at]).lower()
+        value = " ".join(arguments[value_at + 1:])
+
+        if name == "hash":
+            self.searcher.table = search_.TranspositionTable(table_bits(max(1, int(value))))
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+            self.book = book_.OpeningBook(value) if value and value != "<empty>" else None
+        elif name == "tablebasepath":
+            if self.tablebases is not None:
+                self.tablebases.close()
+            self.tablebases = tablebase_.Tablebases(value) if value and value != "<empty>" else None
+            self.searcher.tablebases = self.tablebases
+
+    def set_position(self, arguments):
+        """
+        :param arguments: tokens of "startpos" or "fen <6 fields>", then optionally "moves" and moves
+        """
+        moves_at = arguments.index("moves") if "moves" in arguments else len(arguments)
+        if arguments and arguments[0] == "fen":
+            position = fen_.from_fen(" ".join(arguments[1:moves_at]))
+        else:
+            position = Chess(setup="default")
+        for text in arguments[moves_at + 1:]:
+            move = Move.from_string(text)
+            if not position.is_legal(move):
+                self.send("info string illegal move " + text)
+                break
+            position.make_move(move)
+        self.position = position  # A new object: a running search keeps its own position
+
+    def go(self, parameters):
+        """
+        Start a search in the background, the best move is sent when it ends
+        :param parameters: dictionary of parse_go
+        """
+        position = self.position
+        infinite = parameters["infinite"] or parameters["ponder"]
+        time_limit = allocate_time(parameters, position.is_current_white)
+
+        if self.book is not None and not infinite:
+            move = self.book.choose(position)
+            if move is not None:
+                self.send("bestmove {}".format(move))
+                return
+
+        depth = parameters.get("depth")
+        if "mate" in parameters:
+            depth = 2 * parameters["mate"] - 1
+        if depth is None:
+            depth = search_.MAX_DEPTH if time_limit is not None or infinite else search_.DEFAULT_DEPTH
+        if parameters["ponder"]:  # The clock starts on ponderhit
+            self._time_limit, time_limit = time_limit, None
+        elif infinite:
+            time_limit = None
+
+        self._stop.clear()
+        if infinite:
+            self._release.clear()
+        else:
+            self._release.set()
+        self._start = time.perf_counter()
+        self._search = self.loop.run_in_executor(self._executor, self._run_search, position, depth, time_limit)
+        self._search.add_done_callback(self._search_done)
+        self.loop.create_task(self._report_nodes(self._search))
+
+    def _run_search(self, position, depth, time_limit):
+        """Worker thread: search, then wait for stop or ponderhit if the search is infinite"""
+        result = self.searcher.search(position, depth=depth, time_limit=time_limit, stop_event=self._stop,
+                                      callback=self._report_iteration)
+        self._release.wait()
+        return result
+
+    def _report_iteration(self, result):
+        elapsed = time.perf_counter() - self._start
+        self._send_threadsafe("info depth {} score {} nodes {} nps {} time {} pv {}".format(
+            result.depth, format_score(result.score), result.nodes, int(result.nodes / max(elapsed, 1e-6)),
+            int(elapsed * 1000), " ".join(str(move) for move in result.pv)))
+
+    async def _report_nodes(self, search):
+        """Stream the node count and speed while the search runs"""
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(search), INFO_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                elapsed = time.perf_counter() - self._start
+                nodes = self.searcher.nodes
+                self.send("info nodes {} nps {} time {}".format(nodes, int(nodes / elapsed), int(elapsed * 1000)))
+            except Exception:
+                return  # The search failed, _search_done reports it
+
+    def _search_done(self, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.send("info string search failed: {!r}".format(future.exception()))
+            self.send("bestmove 0000")
+            return
+        result = future.result()
+        if result.best_move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send("bestmove {} ponder {}".format(result.best_move, result.pv[1]))
+        else:
+            self.send("bestmove {}".format(result.best_move))
+
+    def ponderhit(self):
+        """The opponent played the pondered move: the search goes on with the time of a normal move"""
+        if self._search is None or self._search.done():
+            return
+        if self._time_limit is not None:
+            self.searcher.deadline = time.perf_counter() + self._time_limit
+        self._time_limit = None
+        self._release.set()  # Without a time limit the search ends at its depth, its best move is then sent
+
+    async def stop(self):
+        """End the running search, if any, and wait for its best move to be sent"""
+        search = self._search
+        if search is None:
+            return
+        self._stop.set()
+        self._release.set()
+        try:
+            await search
+        except Exception:
+            pass
+        await asyncio.sleep(0)  # Let the done callback send the best move before the next command
+        self._search = None
+
+
+def main():
+    asyncio.run(UciEngine().run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from src import *
+
+import random
+
+# Zobrist keys: a fixed random 64-bit number per piece code and square, one for black to move, one per castling
+# right and one per file of the en passant square.
+# The seed is fixed so that keys are the same in every process and can be stored on disk.
+_random = random.Random(20200523)
+
+PIECE_KEYS = [[_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+_CASTLING_RIGHT_KEYS = [_random.getrandbits(64) for _ in range(4)]
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]  # Key = file of the en passant square
+
+# Key = castling rights as the bits of Chess.castling_rights, the XOR of the keys of every right
+CASTLING_KEYS = []
+for _rights in range(16):
+    _key = 0
+    for _bit in range(4):
+        if _rights >> _bit & 1:
+            _key ^= _CASTLING_RIGHT_KEYS[_bit]
+    CASTLING_KEYS.append(_key)
+
+
+def compute_key(bitboards, is_current_white, castling_rights=0, en_passant_index=None):
+    """
+    Full computation of the Zobrist hash of a position
+    :param bitboards: list of the 12 piece bitboards, see Chess.bitboards
+    :param is_current_white: True if white is to move
+    :param castling_rights: bits of the castling rights, see Chess.castling_rights
+    :param en_passant_index: index of the en passant square, None if there is none
+    :return: 64-bit integer
+    """
+    key = 0 if is_current_white else BLACK_TO_MOVE_KEY
+    key ^= CASTLING_KEYS[castling_rights]
+    if en_passant_index is not None:
+        key ^= EN_PASSANT_KEYS[en_passant_index % 8]
+    for code, bb in enumerate(bitboards):
+        keys = PIECE_KEYS[code]
+        for index in bitboard_.iter_bits(bb):
+            key ^= keys[index]
+    return key